@@ -2,9 +2,11 @@ import streamlit as st
 
 import client
 import pdf_handler
+import flashcard_queue
 import graph
+import metrics
 from client import model
-from database import database_manager
+from database import database_manager, ingestion_jobs, quiz_bank
 import os
 import shutil
 import tempfile
@@ -16,12 +18,50 @@ def ask_question_on_notes(question, notes_text):
     )
     return response.text
 
+def show_ingestion_jobs(project_id):
+    """Shows the progress of the project's queued and running ingestion jobs and recent failures"""
+    jobs = ingestion_jobs.get_jobs(project_id)
+    active = [job for job in jobs if job['status'] in ingestion_jobs.ACTIVE_STATUSES]
+    for job in active:
+        st.info(f"⏳ {job['file_name']}: {job['status']} - {job['pages_processed']} pages read, "
+                f"{job['chunks_embedded']} chunks embedded")
+    for job in jobs[:5]:
+        if job['status'] == 'failed':
+            st.error(f"Failed to process {job['file_name']}: {job['error']}")
+
+    had_active = st.session_state.get('had_active_jobs', False)
+    st.session_state.had_active_jobs = bool(active)
+    if had_active and not active:
+        # a job just finished, rerun the whole page so the document list picks it up
+        st.rerun()
+    if active and st.button("🔄 Refresh progress"):
+        st.rerun()
+
+def show_metrics_panel():
+    """Per-stage timings of the latest requests, shown in the sidebar when METRICS_PANEL is set"""
+    with st.expander("⏱️ Timings"):
+        requests = metrics.recent_requests()
+        if not requests:
+            st.caption("No timed requests yet")
+        for request in requests[:5]:
+            st.markdown(f"**{request['name']}** - {request['total_ms']:.0f} ms")
+            st.table([{'stage': stage, 'count': count, 'ms': round(ms, 1)}
+                      for stage, (count, ms) in metrics.stage_totals(request['spans']).items()])
+        st.download_button("Download Prometheus metrics", metrics.prometheus_text(),
+                           file_name="study_aid_metrics.prom")
+
+# newer Streamlit versions poll the job table without rerunning the whole script; the last job
+# finishing reruns the whole page, which stops the polling until another job is queued
+poll_ingestion_jobs = st.fragment(run_every=2)(show_ingestion_jobs) if hasattr(st, "fragment") else show_ingestion_jobs
+
 def main_app():
 
     session_defaults = {
         'project': None,
         'username': "Guest",
         'uploaded_pdfs': {},
+        # bumped after every handled upload so the uploader starts empty again
+        'uploader_key': 0,
         'selected_pdf': None,
         'quiz_data': {
             'questions': [],
@@ -75,6 +115,13 @@ def main_app():
                 else:
                     st.warning("Please provide both name and path.")
 
+        if st.button("🔄 Rescan projects folder"):
+            database_manager.sync_projects_directory(ingest=ingestion_jobs.submit_ingestion, force=True)
+            st.rerun()
+
+        if metrics.ENABLED and metrics.SHOW_PANEL:
+            show_metrics_panel()
+
     # main content tabs
     tab1, tab2, tab3, tab4, tab5 = st.tabs(["📚 Materials", "❓ Ask Question", "🗺️ Mind Map", "📝 Quiz", "🃏 Flashcards"])
 
@@ -87,21 +134,44 @@ def main_app():
             project_id, project_name, project_path, _ = st.session_state.selected_project
             st.session_state.uploaded_pdfs = database_manager.get_all_documents(project_id)
 
-            uploaded_file = st.file_uploader("Upload PDF", type=["pdf"])
+            uploaded_file = st.file_uploader("Upload PDF", type=["pdf"],
+                                             key=f"pdf_uploader_{st.session_state.uploader_key}")
             if uploaded_file:
                 os.makedirs(os.path.join(project_path, "documents"), exist_ok=True)
                 save_path = os.path.join(project_path, "documents", uploaded_file.name)
 
-                doc_id = database_manager.insert_document(project_id, uploaded_file.name, uploaded_file.name)
-
-                if doc_id is not None:
+                upload_hash = database_manager.hash_bytes(uploaded_file.getbuffer())
+                if database_manager.find_document(project_id, upload_hash) is not None:
+                    st.session_state.upload_message = f"{uploaded_file.name} is already in this project."
+                elif ingestion_jobs.active_job(project_id, uploaded_file.name) is not None:
+                    # overwriting the file would change it under the running job, which reads it from disk
+                    st.session_state.upload_warning = (f"{uploaded_file.name} is still being processed, "
+                                                       "upload the new version again once its job has finished.")
+                else:
+                    # a file with the same name but different content replaces the old one
                     with open(save_path, "wb") as f:
                         f.write(uploaded_file.getbuffer())
-                    st.session_state.uploaded_pdfs[uploaded_file.name] = doc_id
-                    database_manager.parse_insert_document(project_id, doc_id)
+                    ingestion_jobs.submit_ingestion(project_id, uploaded_file.name)
+                    st.session_state.upload_message = f"{uploaded_file.name} was queued for processing."
+                # the uploader would hand the same file to every rerun; clearing it means each upload is
+                # handled once, and uploading the file again after a deletion or a failed job works
+                st.session_state.uploader_key += 1
+                st.rerun()
+
+            upload_message = st.session_state.pop('upload_message', None)
+            upload_warning = st.session_state.pop('upload_warning', None)
+            if upload_warning:
+                st.warning(upload_warning)
+            elif upload_message:
+                st.info(upload_message)
             else:
                 st.warning("No file uploaded yet.")
 
+            if ingestion_jobs.get_jobs(project_id, active_only=True):
+                poll_ingestion_jobs(project_id)
+            else:
+                show_ingestion_jobs(project_id)
+
             if st.session_state.uploaded_pdfs:
                 selected_pdf = st.selectbox(
                     "Select PDF",
@@ -143,12 +213,22 @@ def main_app():
             project_id, project_name, project_path, _ = st.session_state.selected_project
             question = st.text_input("Your question:")
             if question:
+                metrics.set_request_name("ask")
                 with st.spinner("Analyzing content..."):
                     try:
                         context, chunks = database_manager.get_RAG_question_context(question, project_id)
-                        print(context)
-                        response = client.generate_answer(context)
-                        st.info(f"**Answer:** {response}")
+                        response = database_manager.get_cached_answer(question, project_id, chunks)
+                        if response is None:
+                            print(context)
+                            answer_box = st.empty()
+                            response = ""
+                            for piece in client.generate_answer_stream(context):
+                                response += piece
+                                answer_box.info(f"**Answer:** {response}▌")
+                            answer_box.info(f"**Answer:** {response}")
+                            database_manager.cache_answer(question, project_id, chunks, response)
+                        else:
+                            st.info(f"**Answer:** {response}")
                     except Exception as e:
                         st.error(f"Failed to generate answer: {str(e)}")
 
@@ -159,29 +239,57 @@ def main_app():
         else:
             project_id, project_name, project_path, _ = st.session_state.selected_project
             topic = st.text_input("On what topic do you want to build a mind map?")
+            lazy = st.checkbox("Generate subtopics on demand", value=True,
+                               help="Only the main concepts are generated first; selecting a concept generates its subtopics")
             if topic:
-                with st.spinner("Analyzing content..."):
-                    try:
-                        context, chunks = database_manager.get_RAG_mind_map_contex(topic, project_id)
-                        print(context)
-                        graph_save_path = os.path.join(project_path, "mindmaps", f"{topic}.json")
-                        os.makedirs(os.path.dirname(graph_save_path), exist_ok=True)
-                        graph.initialize_mindmap(context, graph_save_path)
-                    except Exception as e:
-                        st.error(f"Failed to generate answer: {str(e)}")
+                graph_save_path = os.path.join(project_path, "mindmaps", f"{topic}.json")
+                fingerprint = database_manager.get_documents_fingerprint(project_id)
+                # reruns keep the map on screen; a saved map of the same topic and documents is reused
+                if (not graph.mindmap_is_current(topic, fingerprint, lazy)
+                        and graph.load_mindmap(graph_save_path, fingerprint, topic, lazy) is None):
+                    metrics.set_request_name("mind map")
+                    with st.spinner("Analyzing content..."):
+                        try:
+                            context, chunks = database_manager.get_RAG_mind_map_contex(topic, project_id)
+                            print(context)
+                            os.makedirs(os.path.dirname(graph_save_path), exist_ok=True)
+                            progress_box = st.empty()
+                            graph.initialize_mindmap(context, graph_save_path, on_text=lambda text: progress_box.caption(
+                                "Concepts so far: " + ", ".join(graph.partial_labels(text))), topic=topic,
+                                fingerprint=fingerprint, lazy=lazy)
+                            progress_box.empty()
+                        except Exception as e:
+                            st.error(f"Failed to generate answer: {str(e)}")
 
         if 'mindmap' in st.session_state and st.session_state.mindmap['graph']:
+            mindmap = st.session_state.mindmap
+            graph.apply_client_selection()
+            if mindmap.get('lazy') and st.session_state.get('selected_project'):
+                map_project_id = st.session_state.selected_project[0]
+                context_fn = lambda query: database_manager.get_RAG_context(query, map_project_id)[0]
+                selected = mindmap.get('selected_node')
+                if selected and graph.can_expand(mindmap, selected):
+                    with st.spinner(f"Generating subtopics of {selected}..."):
+                        graph.expand_node(selected, context_fn)
+                if selected:
+                    # the subtopics of the selected node are the likely next expansions
+                    graph.prefetch_expansions(mindmap['children'].get(selected, []), context_fn)
+
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("🔍 Show Full View"):
                     st.session_state.mindmap['current_root'] = st.session_state.mindmap['initial_root']
                     st.rerun()
             
-            graph.draw_interactive_mindmap()
+            view = st.radio("View", ["Interactive (browser)", "Image"], horizontal=True)
+            if view == "Image":
+                graph.draw_interactive_mindmap()
+            else:
+                graph.draw_client_mindmap()
 
             if st.session_state.mindmap.get('selected_node'):
                 node = st.session_state.mindmap['selected_node']
-                desc = st.session_state.mindmap['graph'].nodes[node].get('desc', 'No description available')
+                desc = st.session_state.mindmap['graph'].nodes[node].get('description', 'No description available')
                 st.markdown(f"**{node}**")
                 st.write(desc)
         else:
@@ -205,23 +313,31 @@ def main_app():
                     topic = st.text_input("Topic", "General Knowledge")
                 
                 if st.button("✨ Generate New Quiz"):
+                    metrics.set_request_name("quiz")
                     with st.spinner("Creating quiz..."):
                         try:
-                            context, chunks = database_manager.get_RAG_context(topic, project_id, top_k=15)
                             quiz_json_path = os.path.join(project_path, "quizzes", f"{topic}.json")
                             os.makedirs(os.path.dirname(quiz_json_path), exist_ok=True)
-                            quiz_raw = pdf_handler.generate_quiz_questions(
-                                context,
-                                num_questions=num_questions,
-                                difficulty=difficulty
+                            # only shown when the bank is short of questions and some have to be generated now
+                            progress = st.empty()
+                            preview = st.empty()
+                            generated = []
+
+                            def show_generated(question):
+                                generated.append(question)
+                                progress.progress(min(len(generated) / num_questions, 1.0),
+                                                  text=f"Generated {len(generated)} new questions")
+                                preview.caption(question['question'])
+
+                            questions = quiz_bank.serve_quiz(
+                                project_id,
+                                topic,
+                                difficulty,
+                                num_questions,
+                                generate=pdf_handler.stream_quiz_questions,
+                                on_question=show_generated
                             )
-                            
-                            if not quiz_raw:
-                                st.error("Failed to generate quiz content")
-                                st.stop()
-                                
-                            questions = pdf_handler.parse_quiz_questions(quiz_raw,
-                                quiz_json_path=quiz_json_path)
+                            pdf_handler.save_quiz_questions(questions, quiz_json_path)
                             
                             if not questions:
                                 st.error("No valid questions parsed")
@@ -437,12 +553,9 @@ def main_app():
                 if not st.session_state.get('current_flashcard') and not is_editing:
                     with st.spinner("Generating a new flashcard..."):
                         try:
-                            context, _ = database_manager.get_RAG_context("General", project_id, top_k=15)
-                            flashcard_raw = pdf_handler.generate_flashcards(context, num_cards=1)
-                            flashcards = pdf_handler.parse_flashcards(flashcard_raw)
-                            if flashcards:
-                                st.session_state.current_flashcard = flashcards[0]
-                                st.success("New flashcard generated!")
+                            flashcard = flashcard_queue.pop_card(project_id, project_path)
+                            if flashcard:
+                                st.session_state.current_flashcard = flashcard
                                 st.rerun()  
                             else:
                                 st.error("Failed to generate a valid flashcard")
@@ -0,0 +1,94 @@
+"""Deterministic local stand-ins for the Gemini embedding and generation calls"""
+import hashlib
+import time
+import numpy as np
+
+EMBEDDING_DIM = 768
+
+
+def fake_vector(text, dim=EMBEDDING_DIM):
+    """Same text, same vector: seeded from a hash of the text"""
+    seed = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:16], 16)
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+class FakeEmbedContent:
+    """Replacement for genai.embed_content that sleeps `latency` seconds per request"""
+
+    def __init__(self, latency=0.05, dim=EMBEDDING_DIM):
+        self.latency = latency
+        self.dim = dim
+        self.calls = 0
+
+    def __call__(self, model=None, content=None, task_type=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        if isinstance(content, str):
+            return {'embedding': fake_vector(content, self.dim).tolist()}
+        return {'embedding': [fake_vector(text, self.dim).tolist() for text in content]}
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+        self.parts = [text]
+
+
+class FakeResponse:
+    def __init__(self, pieces, token_latency):
+        self._pieces = pieces
+        self._token_latency = token_latency
+        self.text = "".join(pieces)
+
+    def __iter__(self):
+        for piece in self._pieces:
+            time.sleep(self._token_latency)
+            yield FakeChunk(piece)
+
+
+class FakeGenerativeModel:
+    """Replacement for client.model; answers with a canned text that depends on the prompt.
+
+    A blocking call waits `latency` plus `token_latency` per piece; a streamed call waits
+    `latency` before the first piece and `token_latency` before each one.
+    """
+
+    def __init__(self, latency=0.5, token_latency=0.01, pieces=40):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.pieces = pieces
+        self.calls = 0
+
+    def response_pieces(self, prompt):
+        if "multiple-choice" in prompt:
+            text = "".join(f"Question {i + 1}: Synthetic question {i + 1}?\nA) one\nB) two\nC) three\nD) four\n"
+                           f"Correct Answer: {'ABCD'[i % 4]}\n\n" for i in range(5))
+        elif '"nodes"' in prompt:
+            text = ('{"nodes": [{"id": "1", "label": "Root"}, {"id": "2", "label": "Child"}], '
+                    '"edges": [{"source": "1", "target": "2", "relation": "contains"}]}')
+        else:
+            text = f"Synthetic answer for a prompt of {len(prompt)} characters. " * 4
+        size = max(1, len(text) // self.pieces)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def generate_content(self, contents=None, stream=False, **kwargs):
+        self.calls += 1
+        pieces = self.response_pieces(str(contents))
+        time.sleep(self.latency)
+        if not stream:
+            time.sleep(self.token_latency * len(pieces))
+        return FakeResponse(pieces, self.token_latency if stream else 0)
+
+
+def install_fakes(embed_latency=0.05, model_latency=0.5, token_latency=0.01):
+    """Points genai.embed_content and client.model at the fakes, returns (embed_content, model)"""
+    import google.generativeai as genai
+    import client
+    import pdf_handler
+
+    embed_content = FakeEmbedContent(latency=embed_latency)
+    model = FakeGenerativeModel(latency=model_latency, token_latency=token_latency)
+    genai.embed_content = embed_content
+    client.model = model
+    pdf_handler.model = model
+    return embed_content, model
@@ -0,0 +1,236 @@
+"""Offline end-to-end benchmarks for ingestion, retrieval and context assembly.
+
+Gemini is replaced by the deterministic fakes in benchmarks/fakes.py and everything runs in a
+temporary database and projects folder. Results are written to benchmarks/results/<timestamp>.json.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+# chunks inserted per synthetic document when filling the search projects
+SEARCH_DOCUMENT_SIZE = 10000
+
+
+def summarize(latencies, items=None):
+    """p50/p95/mean latency in ms and, given the number of processed items, throughput per second"""
+    latencies = np.asarray(latencies, dtype=np.float64)
+    summary = {
+        'runs': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'mean_ms': float(latencies.mean() * 1000),
+        'total_s': float(latencies.sum()),
+    }
+    if items is not None:
+        summary['throughput_per_s'] = items / summary['total_s'] if summary['total_s'] else 0.0
+    return summary
+
+
+def timed(verbose, fn, *args, **kwargs):
+    """Returns (seconds, result) of one call, hiding what it prints unless verbose"""
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        return time.perf_counter() - start, result
+
+
+def report(results, name, summary):
+    results[name] = summary
+    line = f"{name:40s} p50 {summary['p50_ms']:9.2f} ms  p95 {summary['p95_ms']:9.2f} ms"
+    if 'throughput_per_s' in summary:
+        line += f"  {summary['throughput_per_s']:9.1f} {summary.get('unit', 'items')}/s"
+    print(line)
+
+
+def create_project(dm, workdir, name):
+    path = os.path.join(workdir, "projects", name)
+    os.makedirs(os.path.join(path, "documents"), exist_ok=True)
+    dm.insert_project(name, path)
+    project_id = next(p[0] for p in dm.get_all_projects() if p[1] == name)
+    return project_id, path
+
+
+def bench_ingestion(dm, workdir, args, results):
+    from benchmarks.synthetic import make_text_pdf, make_scanned_pdf
+    from database.pdf_parsing import pdf_parse
+
+    kinds = [("text", make_text_pdf, args.text_pdfs, args.pages)]
+    tesseract = shutil.which("tesseract")
+    if tesseract:
+        pdf_parse.pytesseract.pytesseract.tesseract_cmd = tesseract
+        kinds.append(("scanned", make_scanned_pdf, args.scanned_pdfs, args.scanned_pages))
+    else:
+        print("tesseract not found, skipping scanned PDF ingestion")
+
+    for kind, make_pdf, count, pages in kinds:
+        project_id, path = create_project(dm, workdir, f"ingest_{kind}")
+        latencies, total_pages, total_chunks = [], 0, 0
+        for i in range(count):
+            file_name = f"{kind}_{i}.pdf"
+            make_pdf(os.path.join(path, "documents", file_name), pages=pages, seed=1000 + i)
+            progress = {}
+            seconds, _ = timed(args.verbose, dm.parse_insert_document, project_id, file_name,
+                               progress=lambda p, c: progress.update(pages=p, chunks=c))
+            latencies.append(seconds)
+            total_pages += progress.get('pages', 0)
+            total_chunks += progress.get('chunks', 0)
+        summary = summarize(latencies, total_pages)
+        summary.update(unit='pages', chunks=total_chunks,
+                       chunks_per_s=total_chunks / summary['total_s'] if summary['total_s'] else 0.0)
+        report(results, f"parse_insert_document[{kind}]", summary)
+
+
+def fill_search_project(dm, workdir, size, seed=0):
+    """Creates a project with `size` synthetic chunks and random embeddings"""
+    from benchmarks.synthetic import random_texts
+    from benchmarks.fakes import EMBEDDING_DIM
+
+    project_id, _ = create_project(dm, workdir, f"search_{size}")
+    rng = np.random.default_rng(seed)
+    for start in range(0, size, SEARCH_DOCUMENT_SIZE):
+        count = min(SEARCH_DOCUMENT_SIZE, size - start)
+        texts = random_texts(count, words=60, seed=seed + start)
+        vectors = rng.standard_normal((count, EMBEDDING_DIM)).astype(np.float32)
+        entries = [{'text': text, 'page': 1, 'chunk_index': i, 'vector': vectors[i]} for i, text in enumerate(texts)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            dm.insert_document_with_chunks(project_id, f"synthetic_{start}.pdf", f"synthetic-{size}-{start}", entries)
+    return project_id
+
+
+def bench_search(dm, workdir, args, results):
+    from benchmarks.fakes import EMBEDDING_DIM
+    from benchmarks.synthetic import VOCABULARY
+
+    rng = np.random.default_rng(1)
+    for size in args.sizes:
+        load_seconds, project_id = timed(args.verbose, fill_search_project, dm, workdir, size)
+        print(f"Loaded {size} chunks in {load_seconds:.1f} s")
+        queries = rng.standard_normal((args.queries, EMBEDDING_DIM)).astype(np.float32)
+
+        searches = [("search_similar_chunks", dm.search_similar_chunks)]
+        if size >= dm.ANN_MIN_CHUNKS:
+            searches.append(("search_similar_chunks_ann", dm.search_similar_chunks_ann))
+        for name, search in searches:
+            timed(args.verbose, search, queries[0], project_id, top_k=5)  # warm-up: page in, build indexes
+            latencies = [timed(args.verbose, search, query, project_id, top_k=5)[0] for query in queries]
+            report(results, f"{name}[{size}]", summarize(latencies, len(queries)))
+
+        statements = [" ".join(rng.choice(VOCABULARY, size=6)) + f" {i}" for i in range(args.queries)]
+        timed(args.verbose, dm.get_RAG_context, "warm up", project_id)
+        latencies = [timed(args.verbose, dm.get_RAG_context, statement, project_id)[0] for statement in statements]
+        report(results, f"get_RAG_context[{size}]", summarize(latencies, len(statements)))
+
+
+def bench_generation(args, results):
+    """Time to first piece versus time to the full answer with the fake model"""
+    import client
+
+    prompts = [f"Based on this context: synthetic context {i}. Answer the question." for i in range(args.generations)]
+    blocking = [timed(args.verbose, client.generate_answer, prompt)[0] for prompt in prompts]
+    report(results, "generate_answer", summarize(blocking, len(prompts)))
+
+    first_piece = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        for _ in client.generate_answer_stream(prompt):
+            first_piece.append(time.perf_counter() - start)
+            break
+    report(results, "generate_answer_stream[first piece]", summarize(first_piece, len(prompts)))
+
+
+def compare(results, previous_path):
+    with open(previous_path) as f:
+        previous = json.load(f)['results']
+    print(f"\nCompared with {previous_path} (p50, new / old):")
+    for name, summary in results.items():
+        if name in previous and previous[name]['p50_ms']:
+            print(f"{name:40s} {summary['p50_ms'] / previous[name]['p50_ms']:6.2f}x")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline ingestion and retrieval benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="project sizes in chunks for the search benchmarks")
+    parser.add_argument("--queries", type=int, default=50, help="queries per search benchmark")
+    parser.add_argument("--text-pdfs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=20, help="pages per text PDF")
+    parser.add_argument("--scanned-pdfs", type=int, default=2)
+    parser.add_argument("--scanned-pages", type=int, default=3)
+    parser.add_argument("--generations", type=int, default=5)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per fake embedding request")
+    parser.add_argument("--model-latency", type=float, default=0.5, help="seconds before the fake model answers")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds per streamed piece")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["ingestion", "search", "generation"])
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--output", help="results file, defaults to benchmarks/results/<timestamp>.json")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary workspace")
+    parser.add_argument("--verbose", action="store_true", help="show what the benchmarked code prints")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path.insert(0, REPO_DIR)
+    from benchmarks.fakes import install_fakes
+    install_fakes(args.embed_latency, args.model_latency, args.token_latency)
+    from database import database_manager as dm
+
+    workdir = tempfile.mkdtemp(prefix="study-aid-bench-")
+    os.makedirs(os.path.join(workdir, "database"))
+    shutil.copy(os.path.join(REPO_DIR, "database", "db_setup.sql"), os.path.join(workdir, "database", "db_setup.sql"))
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    results = {}
+    try:
+        if "ingestion" not in args.skip:
+            bench_ingestion(dm, workdir, args, results)
+        if "search" not in args.skip:
+            bench_search(dm, workdir, args, results)
+        if "generation" not in args.skip:
+            bench_generation(args, results)
+    finally:
+        os.chdir(previous_dir)
+        if args.keep:
+            print(f"Workspace kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    output = args.output or os.path.join(RESULTS_DIR, f"{timestamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            'timestamp': timestamp,
+            'config': vars(args),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'embedding_storage': dm.EMBEDDING_STORAGE,
+                'retrieval_mode': dm.RETRIEVAL_MODE,
+            },
+            'results': results,
+        }, f, indent=4)
+    print(f"\nResults saved to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Synthetic study material: random-word text, text-layer PDFs and scanned (image-only) PDFs"""
+import fitz
+import numpy as np
+
+VOCABULARY = (
+    "energy matrix protein theorem derivative market cell vector equation history revolution "
+    "enzyme function integral signal network memory language entropy orbit velocity culture "
+    "economy evolution gradient molecule reaction theory proof variable algorithm climate "
+    "population contract hypothesis model system structure process analysis method result"
+).split()
+
+
+def random_text(rng, words):
+    return " ".join(rng.choice(VOCABULARY, size=words))
+
+
+def random_texts(count, words=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return [f"chunk {i} " + random_text(rng, words) for i in range(count)]
+
+
+def _write_page(page, text):
+    page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), text, fontsize=9)
+
+
+def make_text_pdf(path, pages=10, words_per_page=400, seed=0):
+    """Writes a PDF whose pages carry a text layer"""
+    rng = np.random.default_rng(seed)
+    with fitz.open() as doc:
+        for _ in range(pages):
+            _write_page(doc.new_page(), random_text(rng, words_per_page))
+        doc.save(path)
+    return path
+
+
+def make_scanned_pdf(path, pages=2, words_per_page=200, seed=0, dpi=150):
+    """Writes a PDF whose pages are images only, so ingestion has to OCR them"""
+    rng = np.random.default_rng(seed)
+    with fitz.open() as doc, fitz.open() as source:
+        for _ in range(pages):
+            page = source.new_page()
+            _write_page(page, random_text(rng, words_per_page))
+            pix = page.get_pixmap(dpi=dpi)
+            scanned = doc.new_page(width=page.rect.width, height=page.rect.height)
+            scanned.insert_image(scanned.rect, stream=pix.tobytes("png"))
+        doc.save(path)
+    return path
@@ -3,7 +3,9 @@ import streamlit as st
 import networkx as nx
 import json
 import os
+import time
 from dotenv import load_dotenv
+import metrics
 
 load_dotenv()
 api_key = os.getenv("API_KEY")
@@ -11,6 +13,7 @@ genai.configure(api_key=api_key)
 
 model = genai.GenerativeModel("gemini-2.0-flash")
 
+@metrics.timed("llm_generate")
 def generate_answer(question):
     """Generates an answer to a question using Google GenAI and returns the answer."""
     if not question.strip():
@@ -19,6 +22,37 @@ def generate_answer(question):
     answer = model.generate_content(contents=question).text
     return answer
 
+def stream_pieces(prompt):
+    """Yields the text of a Gemini response piece by piece as it is generated, raising on API errors."""
+    start = time.perf_counter()
+    first_piece = True
+    # the stream span also covers the time the caller spends rendering each piece
+    with metrics.span("llm_stream"):
+        for chunk in model.generate_content(contents=prompt, stream=True):
+            if chunk.parts:
+                if first_piece:
+                    metrics.record("llm_first_token", time.perf_counter() - start)
+                    first_piece = False
+                yield chunk.text
+
+def stream_content(prompt):
+    """Like stream_pieces, but an API error is shown with st.error and ends the stream."""
+    try:
+        yield from stream_pieces(prompt)
+    except Exception as e:
+        st.error(f"Generation error: {str(e)}")
+
+def generate_answer_stream(question):
+    """Streaming variant of generate_answer, yields the answer text as it arrives.
+
+    Errors are raised like in generate_answer, so the Ask tab reports them and does not cache a partial answer.
+    """
+    if not question.strip():
+        yield "No question provided."
+        return
+    yield from stream_pieces(question)
+
+@metrics.timed("llm_generate")
 def ask_question_on_notes(question, notes_text):
     """Sends a question and notes to Google GenAI and returns the answer."""
     if not notes_text.strip():
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import numpy as np
+
+INDEX_DIR_NAME = "ann_index"
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 20000
+# retrain the coarse quantizer once the index has grown this much since the last training
+RETRAIN_GROWTH = 4
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _kmeans(matrix, nlist, seed=42):
+    """Spherical k-means on (a sample of) normalized rows, returns the centroids"""
+    rng = np.random.default_rng(seed)
+    if len(matrix) > KMEANS_SAMPLE_SIZE:
+        matrix = matrix[rng.choice(len(matrix), KMEANS_SAMPLE_SIZE, replace=False)]
+    centroids = matrix[rng.choice(len(matrix), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        for j in range(nlist):
+            members = matrix[assignments == j]
+            if len(members):
+                centroids[j] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over normalized embeddings, stored as .npy files in one directory.
+
+    Rows are kept sorted by their coarse cluster, so probing a cluster reads one contiguous slice.
+    Ingestion threads change the index while app threads search it, so every public method holds `lock`.
+    """
+
+    def __init__(self, path, nprobe=8):
+        self.path = path
+        self.nprobe = nprobe
+        self.lock = threading.RLock()
+        self.centroids = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.lists = np.empty(0, dtype=np.int32)
+        self.vectors = None
+        self.trained_size = 0
+
+    @property
+    def size(self):
+        return len(self.ids)
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def load(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        with self.lock:
+            if not os.path.exists(meta_path):
+                return False
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.trained_size = meta.get("trained_size", 0)
+            self.centroids = np.load(os.path.join(self.path, "centroids.npy"))
+            self.ids = np.load(os.path.join(self.path, "ids.npy"))
+            self.lists = np.load(os.path.join(self.path, "lists.npy"))
+            self.vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+            return True
+
+    def save(self):
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            self._save_array("centroids.npy", self.centroids)
+            self._save_array("ids.npy", self.ids)
+            self._save_array("lists.npy", self.lists)
+            self._save_array("vectors.npy", np.asarray(self.vectors, dtype=np.float32))
+            meta_path = os.path.join(self.path, "meta.json")
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump({"trained_size": self.trained_size, "size": self.size}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+
+    def _save_array(self, name, array):
+        """Writes to a temporary file first; after load() vectors.npy is still memory-mapped by self.vectors"""
+        path = os.path.join(self.path, name)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(path + ".tmp", path)
+
+    def build(self, ids, matrix):
+        """Trains the clusters from scratch and indexes all given rows"""
+        matrix = _normalize(matrix)
+        nlist = max(1, min(1024, int(np.sqrt(len(matrix)))))
+        with self.lock:
+            self.centroids = _kmeans(matrix, nlist) if len(matrix) else None
+            self.trained_size = len(matrix)
+            self.ids = np.empty(0, dtype=np.int64)
+            self.lists = np.empty(0, dtype=np.int32)
+            self.vectors = np.empty((0, matrix.shape[1] if matrix.ndim == 2 else 0), dtype=np.float32)
+            if len(matrix):
+                self._insert(np.asarray(ids, dtype=np.int64), matrix)
+
+    def add(self, ids, matrix):
+        """Adds rows to the index, retraining the clusters when the index has outgrown them.
+
+        Ids that are already indexed are skipped, e.g. when a rebuild picked up a batch before its own add.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        with self.lock:
+            new = ~np.isin(ids, self.ids)
+            if not new.any():
+                return
+            ids = ids[new]
+            matrix = _normalize(np.asarray(matrix)[new])
+            if not self.is_trained or self.size + len(ids) > RETRAIN_GROWTH * max(self.trained_size, 1):
+                all_ids = np.concatenate([self.ids, ids])
+                all_vectors = np.vstack([np.asarray(self.vectors), matrix]) if self.size else matrix
+                self.build(all_ids, all_vectors)
+            else:
+                self._insert(ids, matrix)
+
+    def remove(self, ids):
+        with self.lock:
+            keep = ~np.isin(self.ids, np.asarray(ids, dtype=np.int64))
+            self.ids, self.lists, self.vectors = self.ids[keep], self.lists[keep], np.asarray(self.vectors)[keep]
+
+    def _insert(self, ids, matrix):
+        lists = np.argmax(matrix @ self.centroids.T, axis=1).astype(np.int32)
+        all_lists = np.concatenate([self.lists, lists])
+        order = np.argsort(all_lists, kind="stable")
+        vectors = np.vstack([np.asarray(self.vectors), matrix])[order] if self.size else matrix[order]
+        self.lists, self.ids, self.vectors = all_lists[order], np.concatenate([self.ids, ids])[order], vectors
+
+    def search(self, query_vector, top_k=5, nprobe=None):
+        """Returns (scores, chunk_ids) of the approximate top_k rows, best first"""
+        query = _normalize(query_vector)[0]
+        with self.lock:
+            if not self.is_trained or self.size == 0:
+                return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+            nprobe = min(nprobe or self.nprobe, len(self.centroids))
+            probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+            starts = np.searchsorted(self.lists, probe, side="left")
+            ends = np.searchsorted(self.lists, probe, side="right")
+            rows = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+            if len(rows) == 0:
+                return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+
+            scores = np.asarray(self.vectors[rows]) @ query
+            k = min(top_k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return scores[top], self.ids[rows[top]]
@@ -1,15 +1,155 @@
 import sqlite3
 import hashlib
+import threading
+import contextlib
+import queue
 import numpy as np
 from datetime import datetime
 import os
-from database.pdf_parsing.pdf_parse import PDFParser, retrieve_question_answer
+import re
+from database.pdf_parsing.pdf_parse import PDFParser, retrieve_question_answer, EMBEDDING_MODEL, QUERY_TASK_TYPE
+from database.ann_index import IVFIndex, INDEX_DIR_NAME
+from database.embedding_store import EmbeddingStore, TOMBSTONE
+from database.database_setup import setup_database
+from database.embedding_cache import QueryEmbeddingCache, ChunkEmbeddingCache, AnswerCache
+import metrics
 
 DB_NAME = 'database/projects.db'
-pdf_parser = PDFParser()
 
+# applied once to every new connection; WAL lets readers in other sessions run while an ingest is writing
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -65536",  # 64 MB page cache
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+)
+
+# approximate search is used for projects with at least ANN_MIN_CHUNKS chunks, exact search below that
+USE_ANN_INDEX = True
+ANN_MIN_CHUNKS = 2000
+ANN_NPROBE = 8
+# "vector" ranks chunks by cosine similarity only, "hybrid" fuses it with BM25 scores from text_chunks_fts
+RETRIEVAL_MODE = "hybrid"
+# weight of the cosine score in the hybrid score, the BM25 score gets the rest
+HYBRID_ALPHA = 0.6
+# candidates taken from each ranking before fusing
+HYBRID_CANDIDATES = 200
+# from this project size on, hybrid search only scores the vectors of the lexical candidates
+LEXICAL_PREFILTER_MIN_CHUNKS = 20000
+# compact a project's embedding file once this share of its rows is tombstoned
+COMPACT_DEAD_FRACTION = 0.3
+# "float32" scans the full-precision embeddings; "float16" or "int8" scans a compact copy first and
+# rescores the best RESCORE_FACTOR * top_k rows (at least RESCORE_MIN_CANDIDATES) at full precision
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "float32")
+RESCORE_FACTOR = 4
+RESCORE_MIN_CANDIDATES = 50
+# an Ask tab answer is reused for a question at least this cosine-similar that retrieves the same chunks
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_MAX_ENTRIES = 200
+
+# project_id -> EmbeddingStore
+_embedding_stores = {}
+# project_id -> IVFIndex
+_ann_indexes = {}
+# guards creating the per-project embedding stores and ANN indexes
+_registry_lock = threading.RLock()
+# documents left in 'indexing' state by a previous run are only cleaned up once per process
+_documents_prepared = False
+_documents_prepared_lock = threading.Lock()
+# the projects folder is scanned once per process, not on every Streamlit rerun
+_projects_synced = False
+_sync_lock = threading.Lock()
+
+# Streamlit runs every rerun on a new thread, so connections are shared through a small pool
+# instead of being opened (and tuned with CONNECTION_PRAGMAS) again by every rerun
+POOL_SIZE = 8
+# DB_NAME -> queue.Queue of idle connections
+_pools = {}
+_pools_lock = threading.Lock()
+# (DB_NAME, connection) held by this thread, so nested connect() blocks share one connection
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+def open_connection():
+    conn = sqlite3.connect(DB_NAME, timeout=30, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    ensure_schema(conn)
+    return conn
+
+@contextlib.contextmanager
 def connect():
-    return sqlite3.connect(DB_NAME)
+    """Lends a pooled connection to DB_NAME for the block, committing at its end or rolling back on error.
+
+    Nested blocks on one thread share the outer block's connection inside a savepoint and leave the commit
+    to the outermost block; the connection returns to the pool when the outermost block ends.
+    """
+    held = getattr(_local, 'held', None)
+    if held is not None and held[0] == DB_NAME:
+        conn = held[1]
+        conn.execute("SAVEPOINT nested")
+        try:
+            yield NestedConnection(conn)
+            conn.execute("RELEASE nested")
+        except BaseException:
+            conn.execute("ROLLBACK TO nested")
+            conn.execute("RELEASE nested")
+            raise
+        return
+
+    with _pools_lock:
+        pool = _pools.setdefault(DB_NAME, queue.Queue(maxsize=POOL_SIZE))
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = open_connection()
+    _local.held = (DB_NAME, conn)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _local.held = held
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+class NestedConnection:
+    """The connection of an outer connect() block as seen by a nested one.
+
+    commit() does nothing, so a helper cannot commit its caller's half-finished transaction, and
+    rollback() only undoes the nested block's savepoint.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._conn.execute("ROLLBACK TO nested")
+
+def ensure_schema(conn):
+    """Runs the (idempotent) schema script once per process so new tables reach existing databases"""
+    with _schema_lock:
+        if DB_NAME in _schema_ready:
+            return
+        setup_database(conn)
+        _schema_ready.add(DB_NAME)
+
+query_embedding_cache = QueryEmbeddingCache(connect)
+answer_cache = AnswerCache(connect, threshold=ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES)
+pdf_parser = PDFParser(embedding_cache=ChunkEmbeddingCache(connect))
 
 
 def insert_project(name, path):
@@ -19,8 +159,8 @@ def insert_project(name, path):
         conn.commit()
         return c.lastrowid
 
-def insert_document(project_id, file_name, file_content):
-    file_hash = hash_file(file_content)
+def insert_document(project_id, file_name, file_path):
+    file_hash = hash_file(file_path)
     with connect() as conn:
         c = conn.cursor()
         c.execute("SELECT id FROM documents WHERE project_id = ? AND file_hash = ?", (project_id, file_hash))
@@ -33,44 +173,204 @@ def insert_document(project_id, file_name, file_content):
             conn.commit()
             return c.lastrowid
 
-def parse_insert_document(project_id, document_id):
-    ve = None
-    print(f"Parsing document {document_id} for project {project_id}")
+def find_document(project_id, file_hash):
     with connect() as conn:
         c = conn.cursor()
-        c.execute("SELECT path FROM projects WHERE id = ?", (project_id,))
-        project_path = c.fetchone()[0]
-        c.execute("SELECT file_name FROM documents WHERE id = ?", (document_id,))
-        file_name = c.fetchone()[0]
-        file_path = os.path.join(project_path, "documents", file_name)
-        if not os.path.exists(file_path):
-            print(f"File {file_path} does not exist.")
-            return None
-        with open(file_path, 'rb') as file:
-            ve = pdf_parser.parse_pdf(file)
-    print('vector entries: ', ve)
-    if ve is not None:
-        for vector_entry in ve:
-            insert_text_chunk(document_id, vector_entry['text'], vector_entry['page'], vector_entry['chunk_index'], vector_entry['vector'])
+        c.execute("SELECT id FROM documents WHERE project_id = ? AND file_hash = ?", (project_id, file_hash))
+        row = c.fetchone()
+        return row[0] if row else None
+
+def find_ready_document(file_hash):
+    """Returns (document_id, project_id) of a fully ingested document with this content in any project"""
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, project_id FROM documents WHERE file_hash = ? AND status = 'ready' ORDER BY id LIMIT 1", (file_hash,))
+        return c.fetchone()
+
+def copy_document(source_document_id, source_project_id, project_id, file_name, file_hash):
+    """Adds a document to a project by reusing the chunks and vectors of an identical document, returns its id"""
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, text, page_number, chunk_index FROM text_chunks WHERE document_id = ? ORDER BY chunk_index",
+                  (source_document_id,))
+        rows = c.fetchall()
+    found_ids, vectors = get_embedding_store(source_project_id).get([row[0] for row in rows])
+    if len(found_ids) != len(rows):
+        return None
+    vector_entries = [{'text': text, 'page': page, 'chunk_index': chunk_index, 'vector': vector}
+                      for (_, text, page, chunk_index), vector in zip(rows, vectors)]
+    document_id, chunk_ids = insert_document_with_chunks(project_id, file_name, file_hash, vector_entries)
+    if vector_entries:
+        update_ann_index(project_id, chunk_ids, vectors)
+    print(f"Reused {len(chunk_ids)} chunks of document {source_document_id} for {file_name}")
+    return document_id
+
+def parse_insert_document(project_id, file_name, progress=None):
+    """Streams a PDF from the project's documents folder into the database batch by batch, returns the document id.
+
+    The document is stored with status 'indexing' while its chunks are added, so the first
+    batches are searchable early; it becomes 'ready' at the end and is removed if ingestion fails.
+    A previous version of the file is only deleted once the new one is ready, so a failed re-parse keeps it.
+    progress(pages_processed, chunks_embedded) is called after every page and every stored batch.
+    """
+    file_path = os.path.join(get_project_path(project_id), "documents", file_name)
+    if not os.path.exists(file_path):
+        print(f"File {file_path} does not exist.")
+        return None
+    file_hash = hash_file(file_path)
+    if find_document(project_id, file_hash):
+        print(f"Document {file_name} already exists in project {project_id}.")
+        return None
+    previous_id = get_all_documents(project_id).get(file_name)
+    if previous_id is not None:
+        print(f"Document {file_name} changed on disk, replacing it once the new version is indexed")
+
+    source = find_ready_document(file_hash)
+    if source is not None:
+        document_id = copy_document(source[0], source[1], project_id, file_name, file_hash)
+        if document_id is not None:
+            if previous_id is not None:
+                delete_document(previous_id)
+            return document_id
+
+    print(f"Parsing document {file_name} for project {project_id}")
+    store = get_embedding_store(project_id)
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO documents (project_id, file_name, file_hash, status) VALUES (?, ?, ?, 'indexing')",
+                  (project_id, file_name, file_hash))
+        document_id = c.lastrowid
+        conn.commit()
+
+    chunk_count = 0
+    page_count = 0
+
+    def on_page(page_number):
+        nonlocal page_count
+        page_count = page_number
+        if progress:
+            progress(page_count, chunk_count)
+
+    try:
+        for batch in pdf_parser.iter_vector_entry_batches(file_path, on_page=on_page):
+            with connect() as conn:
+                chunk_ids = insert_chunk_batch(conn.cursor(), store, document_id, batch)
+                conn.commit()
+            update_ann_index(project_id, chunk_ids, np.vstack([ve['vector'] for ve in batch]), save=False)
+            chunk_count += len(batch)
+            print(f"Document {file_name}: {chunk_count} chunks searchable")
+            if progress:
+                progress(page_count, chunk_count)
+    except Exception:
+        print(f"Ingestion of {file_name} failed, removing the partial document")
+        delete_document(document_id)
+        raise
+
+    with connect() as conn:
+        conn.execute("UPDATE documents SET status = 'ready' WHERE id = ?", (document_id,))
+        conn.commit()
+    if previous_id is not None:
+        delete_document(previous_id)
+    index = get_ann_index(project_id)
+    # a document without chunks added nothing, and saving a just loaded index would only rewrite its files
+    if chunk_count and index.is_trained:
+        index.save()
+    return document_id
+
+def insert_document_with_chunks(project_id, file_name, file_hash, vector_entries):
+    """Registers a document and inserts all of its chunks in one transaction, returns (document_id, chunk_ids)"""
+    store = get_embedding_store(project_id)
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO documents (project_id, file_name, file_hash) VALUES (?, ?, ?)", (project_id, file_name, file_hash))
+        document_id = c.lastrowid
+        chunk_ids = insert_chunk_batch(c, store, document_id, vector_entries)
+        conn.commit()
+    print(f"Inserted document {file_name} with {len(chunk_ids)} chunks into project {project_id}")
+    return document_id, chunk_ids
+
+@metrics.timed("db_insert")
+def insert_chunk_batch(c, store, document_id, vector_entries):
+    """Inserts consecutive chunks with executemany on the caller's cursor and appends their vectors, returns chunk ids"""
+    if not vector_entries:
+        return []
+    c.executemany('''
+        INSERT INTO text_chunks (document_id, text, page_number, chunk_index, vector)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(document_id, ve['text'], ve['page'], ve['chunk_index'], b'') for ve in vector_entries])
+    by_index = {ve['chunk_index']: ve['vector'] for ve in vector_entries}
+    c.execute("SELECT id, chunk_index FROM text_chunks WHERE document_id = ? AND chunk_index BETWEEN ? AND ? ORDER BY chunk_index",
+              (document_id, min(by_index), max(by_index)))
+    rows = c.fetchall()
+    chunk_ids = [chunk_id for chunk_id, _ in rows]
+    store.append(chunk_ids, np.vstack([by_index[chunk_index] for _, chunk_index in rows]))
+    return chunk_ids
+
+def prepare_documents_once():
+    """Runs the document clean-ups the first time it is called in a process, before any ingestion starts"""
+    global _documents_prepared
+    with _documents_prepared_lock:
+        if not _documents_prepared:
+            remove_incomplete_documents()
+            update_legacy_file_hashes()
+            _documents_prepared = True
+
+def remove_incomplete_documents():
+    """Deletes documents whose ingestion was interrupted, so the next sync parses them again"""
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, file_name FROM documents WHERE status = 'indexing'")
+        rows = c.fetchall()
+    for document_id, file_name in rows:
+        print(f"Removing incompletely indexed document {file_name}")
+        delete_document(document_id)
 
 def insert_text_chunk(document_id, text, page_number, chunk_index, vector: np.ndarray):
-    vector_blob = vector.astype(np.float32).tobytes()
     print(f"Inserting text chunk for document {document_id}: {text[:30]}... (Page {page_number}, Index {chunk_index})")
+    store = get_embedding_store(get_document_project(document_id))
     with connect() as conn:
         c = conn.cursor()
+        # the vector itself goes to the project's embedding store, the column stays empty
         c.execute('''
             INSERT INTO text_chunks (document_id, text, page_number, chunk_index, vector)
             VALUES (?, ?, ?, ?, ?)
-        ''', (document_id, text, page_number, chunk_index, vector_blob))
+        ''', (document_id, text, page_number, chunk_index, b''))
+        chunk_id = c.lastrowid
+        store.append([chunk_id], vector)
         conn.commit()
-        return c.lastrowid
+        return chunk_id
 
 
-def hash_file(file_content: str):
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def hash_file(file_path):
+    """SHA256 of a file's bytes, read in blocks so large PDFs are never fully loaded"""
     hasher = hashlib.sha256()
-    hasher.update(file_content.encode('utf-8'))
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(block)
     return hasher.hexdigest()
 
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def update_legacy_file_hashes():
+    """Replaces hashes of the file name (used by older versions) with hashes of the file contents"""
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT d.id, d.file_name, d.file_hash, p.path FROM documents d JOIN projects p ON d.project_id = p.id")
+        rows = c.fetchall()
+    updates = []
+    for document_id, file_name, file_hash, project_path in rows:
+        file_path = os.path.join(project_path, "documents", file_name)
+        if file_hash == hash_bytes(file_name.encode('utf-8')) and os.path.exists(file_path):
+            updates.append((hash_file(file_path), document_id))
+    if updates:
+        print(f"Updating content hashes of {len(updates)} documents")
+        with connect() as conn:
+            conn.executemany("UPDATE documents SET file_hash = ? WHERE id = ?", updates)
+            conn.commit()
+
 def get_all_projects():
     with connect() as conn:
         c = conn.cursor()
@@ -84,15 +384,49 @@ def get_all_documents(project_id):
         # return dict with file_name as key
         return {file_name: doc_id for doc_id, file_name in c.fetchall()}
 
+def get_documents_fingerprint(project_id):
+    """Hash over the contents of the project's ready documents; changes when one is added, replaced or removed"""
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT file_hash FROM documents WHERE project_id = ? AND status = 'ready' ORDER BY file_hash",
+                  (project_id,))
+        return hash_bytes("\n".join(file_hash for file_hash, in c.fetchall()).encode('utf-8'))
+
 def delete_document(document_id):
     with connect() as conn:
         c = conn.cursor()
+        c.execute("SELECT project_id FROM documents WHERE id = ?", (document_id,))
+        row = c.fetchone()
+        c.execute("SELECT id FROM text_chunks WHERE document_id = ?", (document_id,))
+        chunk_ids = [chunk_id for chunk_id, in c.fetchall()]
         c.execute("DELETE FROM documents WHERE id = ?", (document_id,))
         conn.commit()
+    if row and chunk_ids:
+        store = get_embedding_store(row[0])
+        store.delete(chunk_ids)
+        if store.dead_fraction() > COMPACT_DEAD_FRACTION:
+            store.compact()
+        index = get_ann_index(row[0])
+        with index.lock:
+            if index.is_trained:
+                index.remove(chunk_ids)
+                index.save()
+
+def embed_query(statement):
+    """Embeds a retrieval query, going through the query embedding cache"""
+    return query_embedding_cache.get(EMBEDDING_MODEL, QUERY_TASK_TYPE, statement, retrieve_question_answer)
 
-def get_RAG_context(statement, project_id, top_k=5):
-    statement_vector = retrieve_question_answer(statement)
-    chunks = search_similar_chunks(statement_vector, project_id, top_k=top_k)
+@metrics.timed("context_build")
+def get_RAG_context(statement, project_id, top_k=5, exact=None, mode=None):
+    statement_vector = embed_query(statement)
+    if exact is None:
+        exact = not USE_ANN_INDEX or count_project_chunks(project_id) < ANN_MIN_CHUNKS
+    if (mode or RETRIEVAL_MODE) == "hybrid":
+        chunks = search_hybrid(statement, statement_vector, project_id, top_k=top_k, exact=exact)
+    elif exact:
+        chunks = search_similar_chunks(statement_vector, project_id, top_k=top_k)
+    else:
+        chunks = search_similar_chunks_ann(statement_vector, project_id, top_k=top_k)
     context = ' '.join([chunk[3] for chunk in chunks])
     return context, chunks
 
@@ -103,62 +437,376 @@ def get_RAG_question_context(question, project_id):
      If the answer is not in the context, say "There is no information about this topic in the documents"."""
     return context, chunks
 
+def get_cached_answer(question, project_id, chunks):
+    """Returns a previously generated answer for a near-identical question over the same chunks, or None"""
+    if not chunks:
+        return None
+    return answer_cache.get(project_id, embed_query(question), [chunk[1] for chunk in chunks])
+
+def cache_answer(question, project_id, chunks, answer):
+    if chunks:
+        answer_cache.put(project_id, question, embed_query(question), [chunk[1] for chunk in chunks], answer)
+
 def get_RAG_mind_map_contex(topic, project_id):
     basic_context, chunks = get_RAG_context(topic, project_id)
     context = f"""Based on this context: {basic_context}
      Create a mind map based on the topic of {topic}."""
     return context, chunks
 
+def get_embedding_store(project_id):
+    """Returns the project's memory-mapped embedding store, moving any legacy BLOB vectors into it first"""
+    store = _embedding_stores.get(project_id)
+    if store is not None:
+        return store
+    # one instance per project, otherwise a second one would keep serving its stale cached view
+    with _registry_lock:
+        store = _embedding_stores.get(project_id)
+        if store is None:
+            compact_format = None if EMBEDDING_STORAGE == "float32" else EMBEDDING_STORAGE
+            store = EmbeddingStore(get_project_path(project_id), compact_format=compact_format)
+            if not store.exists():
+                migrate_blob_vectors(project_id, store)
+            _embedding_stores[project_id] = store
+    return store
+
+def migrate_blob_vectors(project_id, store):
+    """Copies vectors still stored in text_chunks.vector into the store and clears the column"""
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT tc.id, tc.vector
+            FROM text_chunks tc
+            JOIN documents d ON tc.document_id = d.id
+            WHERE d.project_id = ? AND length(tc.vector) > 0
+        """, (project_id,))
+        rows = c.fetchall()
+        if not rows:
+            return
+        print(f"Moving {len(rows)} embeddings of project {project_id} to {store.directory}")
+        store.append([row[0] for row in rows], np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]))
+        c.executemany("UPDATE text_chunks SET vector = x'' WHERE id = ?", [(row[0],) for row in rows])
+        conn.commit()
+
+def compact_embeddings(project_id):
+    get_embedding_store(project_id).compact()
+
+def load_project_matrix(project_id):
+    """Returns (chunk_ids, matrix) of all live, L2-normalized embeddings of a project"""
+    return get_embedding_store(project_id).live()
+
 def search_similar_chunks(query_vector: np.ndarray, project_id: int, top_k=5):
+    return fetch_chunks(vector_top_scores(query_vector, project_id, top_k), project_id)
+
+@metrics.timed("vector_search")
+def vector_top_scores(query_vector, project_id, top_k=5, rescore=True):
+    """Exact cosine search over the project's embedding store, returns [(score, chunk_id)] best first.
+
+    With a compact storage format the compact copy is scanned and only the best candidates are
+    rescored from the float32 rows; rescore=False returns the compact scores as they are.
+    """
+    store = get_embedding_store(project_id)
+    chunk_ids, matrix, compact = store.views()
+    live = chunk_ids != TOMBSTONE
+    if not live.any() or top_k <= 0:
+        return []
+    query = np.asarray(query_vector, dtype=np.float32)
+    query_norm = np.linalg.norm(query)
+    if query_norm != 0:
+        query = query / query_norm
+    live_count = int(live.sum())
+
+    if store.compact_format and query_norm != 0:
+        scores = store.compact_scores(query, compact)
+        scores[~live] = -np.inf
+        if rescore:
+            n = min(max(top_k * RESCORE_FACTOR, RESCORE_MIN_CANDIDATES), live_count)
+            candidates = np.sort(np.argpartition(-scores, n - 1)[:n])
+            scores = np.full(len(chunk_ids), -np.inf, dtype=np.float32)
+            scores[candidates] = np.asarray(matrix[candidates]) @ query
+    elif query_norm == 0:
+        scores = np.zeros(len(chunk_ids), dtype=np.float32)
+        scores[~live] = -np.inf
+    else:
+        scores = np.asarray(matrix @ query)
+        scores[~live] = -np.inf
+
+    k = min(top_k, live_count)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(float(scores[i]), int(chunk_ids[i])) for i in top]
+
+def fts_query(statement):
+    """Turns free text into an FTS5 query that matches any of its words"""
+    return " OR ".join(f'"{term}"' for term in re.findall(r"\w+", statement))
+
+@metrics.timed("lexical_search")
+def lexical_top_scores(statement, project_id, top_k=HYBRID_CANDIDATES):
+    """BM25 search over text_chunks_fts, returns [(score, chunk_id)] best first with higher scores better"""
+    query = fts_query(statement)
+    if not query:
+        return []
     with connect() as conn:
         c = conn.cursor()
         c.execute("""
-            SELECT tc.id, tc.document_id, tc.text, tc.vector, tc.page_number
+            SELECT f.rowid, bm25(text_chunks_fts)
+            FROM text_chunks_fts f
+            JOIN text_chunks tc ON tc.id = f.rowid
+            JOIN documents d ON tc.document_id = d.id
+            WHERE text_chunks_fts MATCH ? AND d.project_id = ?
+            ORDER BY bm25(text_chunks_fts)
+            LIMIT ?
+        """, (query, project_id, top_k))
+        return [(-score, chunk_id) for chunk_id, score in c.fetchall()]
+
+def _min_max(scored_ids):
+    if not scored_ids:
+        return {}
+    scores = np.array([score for score, _ in scored_ids], dtype=np.float64)
+    spread = scores.max() - scores.min()
+    normalized = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+    return {chunk_id: float(value) for (_, chunk_id), value in zip(scored_ids, normalized)}
+
+def search_hybrid(statement, query_vector, project_id, top_k=5, alpha=HYBRID_ALPHA, exact=True, prefilter=None):
+    """Ranks chunks by alpha * cosine + (1 - alpha) * BM25, both min-max normalized over the candidates.
+
+    With prefilter (default: projects of LEXICAL_PREFILTER_MIN_CHUNKS or more) only the lexical
+    candidates are scored against the query vector instead of the whole project.
+    """
+    lexical = lexical_top_scores(statement, project_id, HYBRID_CANDIDATES)
+    if prefilter is None:
+        prefilter = count_project_chunks(project_id) >= LEXICAL_PREFILTER_MIN_CHUNKS
+    if prefilter and len(lexical) >= top_k:
+        candidate_ids, vectors = get_embedding_store(project_id).get([chunk_id for _, chunk_id in lexical])
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        semantic = list(zip((vectors @ query).tolist(), candidate_ids.tolist()))
+    elif exact:
+        semantic = vector_top_scores(query_vector, project_id, HYBRID_CANDIDATES)
+    else:
+        semantic = ann_top_scores(query_vector, project_id, HYBRID_CANDIDATES)
+
+    semantic_scores = _min_max(semantic)
+    lexical_scores = _min_max(lexical)
+    fused = [(alpha * semantic_scores.get(chunk_id, 0.0) + (1 - alpha) * lexical_scores.get(chunk_id, 0.0), chunk_id)
+             for chunk_id in set(semantic_scores) | set(lexical_scores)]
+    fused.sort(reverse=True)
+    return fetch_chunks(fused[:top_k], project_id)
+
+def get_project_path(project_id):
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT path FROM projects WHERE id = ?", (project_id,))
+        return c.fetchone()[0]
+
+def get_document_project(document_id):
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT project_id FROM documents WHERE id = ?", (document_id,))
+        return c.fetchone()[0]
+
+def count_project_chunks(project_id):
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT COUNT(*)
             FROM text_chunks tc
             JOIN documents d ON tc.document_id = d.id
             WHERE d.project_id = ?
         """, (project_id,))
-        results = []
-        for chunk_id, doc_id, text, vec_blob, page_number in c.fetchall():
-            vec = np.frombuffer(vec_blob, dtype=np.float32)
-            sim = cosine_similarity(query_vector, vec)
-            results.append((sim, chunk_id, doc_id, text, page_number))
-        results.sort(reverse=True)
-        return results[:top_k]
+        return c.fetchone()[0]
+
+def get_ann_index(project_id):
+    """Returns the project's IVF index, loading it from projects/<name>/ann_index if it was saved before"""
+    index = _ann_indexes.get(project_id)
+    if index is not None:
+        return index
+    with _registry_lock:
+        index = _ann_indexes.get(project_id)
+        if index is None:
+            index = IVFIndex(os.path.join(get_project_path(project_id), INDEX_DIR_NAME), nprobe=ANN_NPROBE)
+            index.load()
+            _ann_indexes[project_id] = index
+    return index
+
+def rebuild_ann_index(project_id):
+    """Retrains the project's index from every chunk currently stored in the database"""
+    index = get_ann_index(project_id)
+    with index.lock:
+        chunk_ids, matrix = load_project_matrix(project_id)
+        index.build(chunk_ids, matrix)
+        index.save()
+    return index
+
+def update_ann_index(project_id, chunk_ids, vectors, save=True):
+    """Adds freshly inserted chunks to the index, building it once the project is big enough"""
+    index = get_ann_index(project_id)
+    with index.lock:
+        if not index.is_trained:
+            if count_project_chunks(project_id) >= ANN_MIN_CHUNKS:
+                rebuild_ann_index(project_id)
+            return
+        index.add(chunk_ids, vectors)
+        if save:
+            index.save()
+
+def has_indexing_document(project_id):
+    """True while a document of the project is being ingested and its chunks are still reaching the index"""
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM documents WHERE project_id = ? AND status = 'indexing' LIMIT 1", (project_id,))
+        return c.fetchone() is not None
+
+def search_similar_chunks_ann(query_vector: np.ndarray, project_id: int, top_k=5, nprobe=None):
+    return fetch_chunks(ann_top_scores(query_vector, project_id, top_k, nprobe), project_id)
+
+@metrics.timed("ann_search")
+def ann_top_scores(query_vector, project_id, top_k=5, nprobe=None):
+    """Approximate cosine search through the project's IVF index, returns [(score, chunk_id)] best first"""
+    index = get_ann_index(project_id)
+    # during ingestion a committed batch is briefly missing from the index; its own add() follows
+    if index.size != count_project_chunks(project_id) and not has_indexing_document(project_id):
+        index = rebuild_ann_index(project_id)
+    scores, chunk_ids = index.search(query_vector, top_k=top_k, nprobe=nprobe)
+    return list(zip(scores.tolist(), chunk_ids.tolist()))
+
+def measure_ann_recall(project_id, num_queries=50, top_k=5, nprobe=None, seed=0):
+    """Compares approximate and exact top_k results using stored chunks as queries, returns mean recall"""
+    _, matrix = load_project_matrix(project_id)
+    if len(matrix) == 0:
+        return 1.0
+    rng = np.random.default_rng(seed)
+    queries = matrix[rng.choice(len(matrix), min(num_queries, len(matrix)), replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    recalls = []
+    for query in queries:
+        exact_ids = {chunk[1] for chunk in search_similar_chunks(query, project_id, top_k=top_k)}
+        ann_ids = {chunk[1] for chunk in search_similar_chunks_ann(query, project_id, top_k=top_k, nprobe=nprobe)}
+        recalls.append(len(exact_ids & ann_ids) / len(exact_ids))
+    recall = float(np.mean(recalls))
+    print(f"ANN recall@{top_k} for project {project_id}: {recall:.3f}")
+    return recall
+
+@metrics.timed("fetch_chunks")
+def fetch_chunks(scored_ids, project_id):
+    """Loads text rows of the project for (score, chunk_id) pairs, keeping the given order"""
+    if not scored_ids:
+        return []
+    ids = [chunk_id for _, chunk_id in scored_ids]
+    placeholders = ",".join("?" * len(ids))
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT tc.id, tc.document_id, tc.text, tc.page_number
+            FROM text_chunks tc
+            JOIN documents d ON tc.document_id = d.id
+            WHERE d.project_id = ? AND tc.id IN ({placeholders})
+        """, [project_id] + ids)
+        rows = {row[0]: row for row in c.fetchall()}
+    return [(score, chunk_id, rows[chunk_id][1], rows[chunk_id][2], rows[chunk_id][3])
+            for score, chunk_id in scored_ids if chunk_id in rows]
 
 def cosine_similarity(vec1, vec2):
     if np.linalg.norm(vec1) == 0 or np.linalg.norm(vec2) == 0:
         return 0.0
     return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
 
-def sync_projects_directory():
+def sync_projects_directory(ingest=parse_insert_document, force=False):
+    """Registers project folders and PDFs found under projects/, once per process unless force is set.
+
+    A documents folder is synced when its mtime differs from the directory manifest (files added or
+    removed) or a PDF's size or mtime differs from the file manifest (rewritten in place, which leaves
+    the folder's mtime alone). Inside it a file whose size or mtime changed is hashed, and handed to
+    ingest(project_id, file_name) unless a document of the project already has that content; documents
+    whose file disappeared are deleted.
+    force=True syncs every folder.
+    """
+    global _projects_synced
+    with _sync_lock:
+        if _projects_synced and not force:
+            return
+        _projects_synced = True
+    prepare_documents_once()
     base_dir = os.path.join(os.getcwd(), 'projects')
     os.makedirs(base_dir, exist_ok=True)
     existing_projects = {name: (pid, path) for pid, name, path, _ in get_all_projects()}
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT path, mtime FROM directory_manifest")
+        directory_mtimes = dict(c.fetchall())
+        c.execute("SELECT path, size, mtime FROM file_manifest")
+        file_stats = {path: (size, mtime) for path, size, mtime in c.fetchall()}
 
     for project_name in os.listdir(base_dir):
         project_path = os.path.join(base_dir, project_name)
-        os.makedirs(os.path.join(project_path, "documents"), exist_ok=True)
         if not os.path.isdir(project_path):
-            continue  
+            continue
+        documents_dir = os.path.join(project_path, "documents")
+        os.makedirs(documents_dir, exist_ok=True)
 
         if project_name not in existing_projects:
             project_id = insert_project(project_name, project_path)
         else:
             project_id = existing_projects[project_name][0]
 
-        existing_docs = get_all_documents(project_id)
+        mtime = os.stat(documents_dir).st_mtime
+        if not force and directory_mtimes.get(documents_dir) == mtime and not files_changed(documents_dir, file_stats):
+            continue
+        sync_project_documents(project_id, documents_dir, ingest)
+        with connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO directory_manifest (path, mtime) VALUES (?, ?)", (documents_dir, mtime))
+            conn.commit()
+
+def files_changed(documents_dir, file_stats):
+    """True if a PDF in the folder is missing from the file manifest or its size or mtime differs"""
+    with os.scandir(documents_dir) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(".pdf") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            if file_stats.get(entry.path) != (stat.st_size, stat.st_mtime):
+                return True
+    return False
 
-        for file_name in os.listdir(os.path.join(project_path, "documents")):
-            if not file_name.lower().endswith(".pdf"):
-                continue  
+def sync_project_documents(project_id, documents_dir, ingest):
+    """Compares one documents folder with the file manifest and the documents table"""
+    with connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT path, size, mtime, content_hash FROM file_manifest WHERE project_id = ?", (project_id,))
+        manifest = {path: (size, mtime, content_hash) for path, size, mtime, content_hash in c.fetchall()}
+    existing_docs = get_all_documents(project_id)
+    present = set()
 
-            if file_name in existing_docs:
-                continue  
+    for file_name in os.listdir(documents_dir):
+        if not file_name.lower().endswith(".pdf"):
+            continue
+        file_path = os.path.join(documents_dir, file_name)
+        present.add(file_name)
+        stat = os.stat(file_path)
+        entry = manifest.get(file_path)
+        if entry and entry[:2] == (stat.st_size, stat.st_mtime) and file_name in existing_docs:
+            continue
 
-            doc_id = insert_document(project_id, file_name, file_name)
-            if doc_id:
-                parse_insert_document(project_id, doc_id)
+        content_hash = hash_file(file_path)
+        with connect() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO file_manifest (path, project_id, size, mtime, content_hash)
+                VALUES (?, ?, ?, ?, ?)
+            """, (file_path, project_id, stat.st_size, stat.st_mtime, content_hash))
+            conn.commit()
+        if find_document(project_id, content_hash) is not None:
+            # only touched, or not in the manifest yet (e.g. the first sync after upgrading) but already ingested
+            continue
+        ingest(project_id, file_name)
+
+    for file_name, document_id in existing_docs.items():
+        if file_name not in present:
+            print(f"Document {file_name} was removed from {documents_dir}")
+            delete_document(document_id)
+    removed = [path for path in manifest if os.path.basename(path) not in present]
+    if removed:
+        with connect() as conn:
+            conn.executemany("DELETE FROM file_manifest WHERE path = ?", [(path,) for path in removed])
+            conn.commit()
 
 if __name__ == "__main__":
     insert_project("Project2", "/path/to/project1")
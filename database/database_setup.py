@@ -2,6 +2,11 @@ import sqlite3
 from sqlite3 import Error
 from pathlib import Path
 
+# columns added after the first release, created on databases that predate them
+COLUMN_MIGRATIONS = [
+    ("documents", "status", "TEXT NOT NULL DEFAULT 'ready'"),
+]
+
 def create_connection(db_file="database/projects.db"):
     """Create a database connection"""
     conn = None
@@ -17,13 +22,30 @@ def setup_database(conn, sql_file="database/db_setup.sql"):
     """Execute SQL from external file"""
     try:
         sql_script = Path(sql_file).read_text()
+        fts_existed = table_exists(conn, "text_chunks_fts")
         conn.executescript(sql_script)
+        add_missing_columns(conn)
+        if not fts_existed:
+            # chunks inserted before the full-text index existed are not covered by its triggers
+            conn.execute("INSERT INTO text_chunks_fts(text_chunks_fts) VALUES ('rebuild')")
+            conn.commit()
         print(f"Database schema loaded from {sql_file}")
     except Error as e:
         print(f"Setup error: {e}")
     except FileNotFoundError:
         print(f"SQL file not found: {sql_file}")
 
+def table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def add_missing_columns(conn):
+    """Adds columns from COLUMN_MIGRATIONS that an existing table does not have yet"""
+    for table, column, definition in COLUMN_MIGRATIONS:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    conn.commit()
+
 if __name__ == "__main__":
     db_conn = create_connection()
     if db_conn:
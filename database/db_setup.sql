@@ -11,6 +11,7 @@ CREATE TABLE IF NOT EXISTS documents (
     project_id INTEGER NOT NULL,
     file_name TEXT NOT NULL,  -- Document name
     file_hash TEXT NOT NULL,  -- SHA256 hash for duplicate prevention
+    status TEXT NOT NULL DEFAULT 'ready',  -- 'indexing' while chunks are still being added
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
 );
@@ -22,10 +23,133 @@ CREATE TABLE IF NOT EXISTS text_chunks (
     page_number INTEGER,
     chunk_index INTEGER NOT NULL,  -- Order in document
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    vector BLOB NOT NULL,
+    vector BLOB,  -- legacy; embeddings live in projects/<name>/embeddings.f32
     FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE
 );
 
 -- Indexes for faster queries
-CREATE INDEX idx_project_docs ON documents(project_id);
-CREATE INDEX idx_doc_chunks ON text_chunks(document_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_project_docs ON documents(project_id);
+CREATE INDEX IF NOT EXISTS idx_doc_chunks ON text_chunks(document_id);
+
+-- Cache of query embeddings, keyed by model, task type and normalized text
+CREATE TABLE IF NOT EXISTS query_embeddings (
+    model TEXT NOT NULL,
+    task_type TEXT NOT NULL,
+    text TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model, task_type, text)
+);
+
+-- Chunk embeddings keyed by sha256 of (model, chunk text), reused across documents and projects
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    hash TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Background ingestion jobs, polled by the Materials tab
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done, failed
+    pages_processed INTEGER NOT NULL DEFAULT 0,
+    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+    document_id INTEGER,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_project_jobs ON ingestion_jobs(project_id, status);
+
+-- Last seen state of project files and documents folders, used to skip unchanged ones when syncing
+CREATE TABLE IF NOT EXISTS file_manifest (
+    path TEXT PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    content_hash TEXT NOT NULL,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS directory_manifest (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+
+-- Full-text index over chunk text for BM25 / hybrid retrieval, kept in sync by triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS text_chunks_fts USING fts5(text, content='text_chunks', content_rowid='id');
+
+CREATE TRIGGER IF NOT EXISTS text_chunks_fts_insert AFTER INSERT ON text_chunks BEGIN
+    INSERT INTO text_chunks_fts(rowid, text) VALUES (new.id, new.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS text_chunks_fts_delete AFTER DELETE ON text_chunks BEGIN
+    INSERT INTO text_chunks_fts(text_chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+
+CREATE TRIGGER IF NOT EXISTS text_chunks_fts_update AFTER UPDATE OF text ON text_chunks BEGIN
+    INSERT INTO text_chunks_fts(text_chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO text_chunks_fts(rowid, text) VALUES (new.id, new.text);
+END;
+
+-- Generated answers of the Ask tab, reused for near-identical questions that retrieve the same chunks
+CREATE TABLE IF NOT EXISTS answer_cache (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    chunk_ids TEXT NOT NULL,  -- JSON list of the retrieved text_chunks ids, in order
+    answer TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at REAL NOT NULL,  -- unix time, for LRU eviction
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_project_answers ON answer_cache(project_id, last_used_at);
+
+-- Adding, replacing or deleting a document changes what the project's answers could be based on
+CREATE TRIGGER IF NOT EXISTS answer_cache_document_insert AFTER INSERT ON documents BEGIN
+    DELETE FROM answer_cache WHERE project_id = new.project_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS answer_cache_document_ready AFTER UPDATE OF status ON documents BEGIN
+    DELETE FROM answer_cache WHERE project_id = new.project_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS answer_cache_document_delete AFTER DELETE ON documents BEGIN
+    DELETE FROM answer_cache WHERE project_id = old.project_id;
+END;
+
+-- Generated quiz questions, served by sampling and refilled in the background
+CREATE TABLE IF NOT EXISTS quiz_questions (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    topic TEXT NOT NULL,  -- normalized topic the question was generated for
+    difficulty TEXT NOT NULL,
+    question TEXT NOT NULL,
+    options TEXT NOT NULL,  -- JSON list
+    answer TEXT NOT NULL,
+    question_hash TEXT NOT NULL,  -- sha256 of the normalized question text, for deduplication
+    served_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+    UNIQUE (project_id, question_hash)
+);
+
+CREATE INDEX IF NOT EXISTS idx_quiz_bank ON quiz_questions(project_id, topic, difficulty, served_count);
+
+-- Chunks whose text a question was generated from; a question is no longer served once all are gone
+CREATE TABLE IF NOT EXISTS quiz_question_chunks (
+    question_id INTEGER NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    PRIMARY KEY (question_id, chunk_id),
+    FOREIGN KEY (question_id) REFERENCES quiz_questions(id) ON DELETE CASCADE,
+    FOREIGN KEY (chunk_id) REFERENCES text_chunks(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_quiz_chunks ON quiz_question_chunks(chunk_id);
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_text(text):
+    return " ".join(text.split()).lower()
+
+
+class QueryEmbeddingCache:
+    """Two-level cache for query embeddings: an in-process LRU in front of the query_embeddings table"""
+
+    def __init__(self, connect, maxsize=1024):
+        self.connect = connect
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, model, task_type, text, embed):
+        """Returns the embedding of text, calling embed(text) only when neither level has it"""
+        key = (model, task_type, normalize_text(text))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return self._entries[key]
+
+        with self.connect() as conn:
+            c = conn.cursor()
+            c.execute("SELECT vector FROM query_embeddings WHERE model = ? AND task_type = ? AND text = ?", key)
+            row = c.fetchone()
+        if row:
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            with self._lock:
+                self.db_hits += 1
+            self._remember(key, vector)
+            return vector
+
+        with self._lock:
+            self.misses += 1
+        embedding = embed(text)
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO query_embeddings (model, task_type, text, vector) VALUES (?, ?, ?, ?)",
+                         key + (vector.tobytes(),))
+        self._remember(key, vector)
+        return vector
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+                'size': len(self._entries),
+            }
+
+
+def chunk_hash(model, text):
+    hasher = hashlib.sha256()
+    hasher.update(model.encode('utf-8'))
+    hasher.update(b'\0')
+    hasher.update(text.encode('utf-8'))
+    return hasher.hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """Content-addressed store of document chunk embeddings in the chunk_embeddings table"""
+
+    LOOKUP_BATCH = 500
+
+    def __init__(self, connect):
+        self.connect = connect
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model, texts):
+        """Returns {position: vector} for the texts that were embedded before"""
+        hashes = [chunk_hash(model, text) for text in texts]
+        found = {}
+        with self.connect() as conn:
+            c = conn.cursor()
+            for start in range(0, len(hashes), self.LOOKUP_BATCH):
+                batch = hashes[start:start + self.LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                c.execute(f"SELECT hash, vector FROM chunk_embeddings WHERE hash IN ({placeholders})", batch)
+                found.update({h: np.frombuffer(blob, dtype=np.float32) for h, blob in c.fetchall()})
+        result = {i: found[h] for i, h in enumerate(hashes) if h in found}
+        self.hits += len(result)
+        self.misses += len(texts) - len(result)
+        return result
+
+    def put_many(self, model, texts, vectors):
+        rows = [(chunk_hash(model, text), model, np.asarray(vector, dtype=np.float32).tobytes())
+                for text, vector in zip(texts, vectors)]
+        with self.connect() as conn:
+            conn.executemany("INSERT OR IGNORE INTO chunk_embeddings (hash, model, vector) VALUES (?, ?, ?)", rows)
+
+
+class AnswerCache:
+    """Per-project cache of generated answers in the answer_cache table, looked up by question embedding.
+
+    A stored answer is returned when its question is at least `threshold` cosine-similar to the new one
+    and it was generated from the same retrieved chunks. Each project keeps its `max_entries` most
+    recently used answers; document changes clear the project's entries through triggers.
+    """
+
+    def __init__(self, connect, threshold=0.95, max_entries=200):
+        self.connect = connect
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, project_id, vector, chunk_ids):
+        """Returns the cached answer for the question vector and retrieved chunk ids, or None"""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        chunk_ids = json.dumps([int(chunk_id) for chunk_id in chunk_ids])
+        with self.connect() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, vector, answer FROM answer_cache WHERE project_id = ? AND chunk_ids = ?",
+                      (project_id, chunk_ids))
+            rows = c.fetchall()
+            if norm == 0 or not rows:
+                self.misses += 1
+                return None
+            matrix = np.vstack([np.frombuffer(blob, dtype=np.float32) for _, blob, _ in rows])
+            scores = matrix @ vector / (np.linalg.norm(matrix, axis=1) * norm)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            c.execute("UPDATE answer_cache SET last_used_at = ? WHERE id = ?", (time.time(), rows[best][0]))
+            conn.commit()
+        self.hits += 1
+        return rows[best][2]
+
+    def put(self, project_id, question, vector, chunk_ids, answer):
+        with self.connect() as conn:
+            conn.execute("""
+                INSERT INTO answer_cache (project_id, question, vector, chunk_ids, answer, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (project_id, question, np.asarray(vector, dtype=np.float32).tobytes(),
+                  json.dumps([int(chunk_id) for chunk_id in chunk_ids]), answer, time.time()))
+            conn.execute("""
+                DELETE FROM answer_cache WHERE project_id = ? AND id NOT IN (
+                    SELECT id FROM answer_cache WHERE project_id = ?
+                    ORDER BY last_used_at DESC, id DESC LIMIT ?
+                )
+            """, (project_id, project_id, self.max_entries))
+            conn.commit()
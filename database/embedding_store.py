@@ -0,0 +1,295 @@
+import json
+import os
+import threading
+import numpy as np
+
+VECTORS_FILE = "embeddings.f32"
+IDS_FILE = "embeddings.ids"
+TOMBSTONE = -1
+# optional compact copies of embeddings.f32 that searches scan before rescoring at full precision
+COMPACT_FILES = {"float16": "embeddings.f16", "int8": "embeddings.i8"}
+COMPACT_DTYPES = {"float16": np.float16, "int8": np.int8}
+SCALES_FILE = "embeddings.scale"
+# bumped by every compact(), which rewrites the row order; a compact copy records the generation and
+# row count it was built for, since its size alone cannot tell a rewritten store from an appended one
+GENERATION_FILE = "embeddings.generation"
+COMPACT_META_FILE = "embeddings.compact.json"
+# rows converted to float32 at a time while scoring the compact copy
+SCORE_BLOCK_ROWS = 16384
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(matrix, compact_format):
+    """Returns (compact rows, per-row scales or None) for the given format"""
+    if compact_format == "float16":
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class EmbeddingStore:
+    """Append-only store of L2-normalized float32 embeddings for one project.
+
+    Two flat files live in the project directory: embeddings.f32 holds the rows and
+    embeddings.ids holds the text_chunks.id of every row (int64). Deleted rows are
+    tombstoned by overwriting their id with -1 and dropped for good by compact().
+    Reads go through np.memmap, so searching a cold project only pages the file in.
+
+    With compact_format "float16" or "int8" (per-row scale in embeddings.scale) a compact
+    copy is kept next to the full-precision file for compact_scores(); embeddings.compact.json
+    records the generation and row count it matches.
+    """
+
+    def __init__(self, directory, compact_format=None):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, VECTORS_FILE)
+        self.ids_path = os.path.join(directory, IDS_FILE)
+        self.compact_format = compact_format
+        self.compact_path = os.path.join(directory, COMPACT_FILES[compact_format]) if compact_format else None
+        self.scales_path = os.path.join(directory, SCALES_FILE)
+        self.generation_path = os.path.join(directory, GENERATION_FILE)
+        self.compact_meta_path = os.path.join(directory, COMPACT_META_FILE)
+        self._lock = threading.RLock()
+        self._view = None
+        self._compact_view = None
+        self._repair()
+
+    def exists(self):
+        return os.path.exists(self.ids_path)
+
+    def _repair(self):
+        """Truncates both files to the same row count after an interrupted append"""
+        if not self.exists() or not os.path.exists(self.vectors_path):
+            return
+        rows = os.path.getsize(self.ids_path) // 8
+        vector_bytes = os.path.getsize(self.vectors_path)
+        if rows == 0:
+            if vector_bytes:
+                open(self.vectors_path, "wb").close()
+            return
+        dim = vector_bytes // (4 * rows)
+        if dim == 0:
+            return
+        rows = min(rows, vector_bytes // (4 * dim))
+        if os.path.getsize(self.ids_path) != rows * 8:
+            with open(self.ids_path, "r+b") as f:
+                f.truncate(rows * 8)
+        if vector_bytes != rows * dim * 4:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(rows * dim * 4)
+
+    def view(self):
+        """Returns (ids, matrix) memmaps over all rows, tombstones included (id == -1)"""
+        with self._lock:
+            if self._view is not None:
+                return self._view
+            rows = os.path.getsize(self.ids_path) // 8 if self.exists() else 0
+            if rows == 0:
+                self._view = (np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+                return self._view
+            dim = os.path.getsize(self.vectors_path) // (4 * rows)
+            ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(rows,))
+            matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+            self._view = (ids, matrix)
+            return self._view
+
+    def views(self):
+        """Returns (ids, matrix, compact) over the same rows, compact being compact_view() or None.
+
+        Searches take the views together, since an append or compact() between two calls changes the rows.
+        """
+        with self._lock:
+            ids, matrix = self.view()
+            return ids, matrix, self.compact_view() if self.compact_format else None
+
+    def _drop_view(self):
+        self._view = None
+        self._compact_view = None
+
+    def generation(self):
+        try:
+            with open(self.generation_path) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _compact_is_current(self, rows):
+        """True if the compact copy was built or appended for this generation and exactly `rows` rows"""
+        if not os.path.exists(self.compact_path):
+            return False
+        try:
+            with open(self.compact_meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return meta == {"format": self.compact_format, "generation": self.generation(), "rows": rows}
+
+    def _write_compact_meta(self, rows):
+        with open(self.compact_meta_path, "w") as f:
+            json.dump({"format": self.compact_format, "generation": self.generation(), "rows": rows}, f)
+
+    def compact_view(self):
+        """Returns (compact rows, scales or None) memmaps, (re)building the compact files if they are out of date"""
+        with self._lock:
+            if self._compact_view is not None:
+                return self._compact_view
+            ids, matrix = self.view()
+            dtype = COMPACT_DTYPES[self.compact_format]
+            if not self._compact_is_current(len(ids)):
+                self.build_compact()
+            if len(ids) == 0:
+                self._compact_view = (np.empty((0, 0), dtype=dtype), None)
+                return self._compact_view
+            data = np.memmap(self.compact_path, dtype=dtype, mode="r", shape=matrix.shape)
+            scales = None
+            if self.compact_format == "int8":
+                scales = np.memmap(self.scales_path, dtype=np.float32, mode="r", shape=(len(ids),))
+            self._compact_view = (data, scales)
+            return self._compact_view
+
+    def build_compact(self, block_rows=SCORE_BLOCK_ROWS):
+        """Rewrites the compact copy from embeddings.f32.
+
+        The files are written next to the old ones and moved into place, because searches may still be
+        reading the old copy through views taken before the rebuild.
+        """
+        with self._lock:
+            _, matrix = self.view()
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_data = self.compact_path + ".tmp"
+            tmp_scales = self.scales_path + ".tmp"
+            with open(tmp_data, "wb") as data_file, open(tmp_scales, "wb") as scales_file:
+                for start in range(0, len(matrix), block_rows):
+                    data, scales = quantize(np.asarray(matrix[start:start + block_rows]), self.compact_format)
+                    data_file.write(data.tobytes())
+                    if scales is not None:
+                        scales_file.write(scales.tobytes())
+            os.replace(tmp_data, self.compact_path)
+            os.replace(tmp_scales, self.scales_path)
+            self._write_compact_meta(len(matrix))
+            self._compact_view = None
+
+    def compact_scores(self, query, compact=None, block_rows=SCORE_BLOCK_ROWS):
+        """Approximate dot products of a normalized query with every row, computed from the compact copy.
+
+        Pass the compact view returned by views() to score the same rows as its ids.
+        """
+        data, scales = compact or self.compact_view()
+        scores = np.empty(len(data), dtype=np.float32)
+        for start in range(0, len(data), block_rows):
+            block = np.asarray(data[start:start + block_rows], dtype=np.float32) @ query
+            if scales is not None:
+                block *= scales[start:start + block_rows]
+            scores[start:start + block_rows] = block
+        return scores
+
+    def nbytes(self):
+        """Returns (full precision bytes, compact bytes) on disk"""
+        full = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        compact = 0
+        if self.compact_format and os.path.exists(self.compact_path):
+            compact = os.path.getsize(self.compact_path)
+            if self.compact_format == "int8" and os.path.exists(self.scales_path):
+                compact += os.path.getsize(self.scales_path)
+        return full, compact
+
+    def append(self, ids, vectors):
+        """Appends normalized rows; an id that is already live is tombstoned first"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return
+        matrix = normalize_rows(vectors)
+        with self._lock:
+            self.delete(ids)
+            rows_before = len(self.view()[0])
+            # a compact copy that is already stale is left alone and rebuilt on its next use
+            extend_compact = self.compact_format and self._compact_is_current(rows_before)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.ids_path, "ab") as f:
+                f.write(ids.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            if extend_compact:
+                data, scales = quantize(matrix, self.compact_format)
+                with open(self.compact_path, "ab") as f:
+                    f.write(data.tobytes())
+                if scales is not None:
+                    with open(self.scales_path, "ab") as f:
+                        f.write(scales.tobytes())
+                self._write_compact_meta(rows_before + len(ids))
+            self._drop_view()
+
+    def delete(self, ids):
+        """Tombstones the rows of the given chunk ids, returns how many rows were hit"""
+        with self._lock:
+            stored_ids, _ = self.view()
+            rows = np.nonzero(np.isin(stored_ids, np.asarray(ids, dtype=np.int64)))[0]
+            if len(rows) == 0:
+                return 0
+            self._drop_view()
+            tombstone = np.int64(TOMBSTONE).tobytes()
+            with open(self.ids_path, "r+b") as f:
+                for row in rows:
+                    f.seek(int(row) * 8)
+                    f.write(tombstone)
+            return len(rows)
+
+    def live(self):
+        """Returns (ids, matrix) copies of the live rows only"""
+        ids, matrix = self.view()
+        mask = ids != TOMBSTONE
+        return np.asarray(ids[mask]), np.asarray(matrix[mask])
+
+    def get(self, ids):
+        """Returns (found_ids, matrix) for the given chunk ids in the given order, skipping unknown ids"""
+        ids = np.asarray(ids, dtype=np.int64)
+        stored_ids, matrix = self.view()
+        if len(stored_ids) == 0 or len(ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, matrix.shape[1]), dtype=np.float32)
+        sorter = np.argsort(stored_ids, kind="stable")
+        positions = np.clip(np.searchsorted(stored_ids, ids, sorter=sorter), 0, len(stored_ids) - 1)
+        rows = sorter[positions]
+        found = np.asarray(stored_ids[rows]) == ids
+        return ids[found], np.asarray(matrix[rows[found]])
+
+    def dead_fraction(self):
+        ids, _ = self.view()
+        if len(ids) == 0:
+            return 0.0
+        return float(np.count_nonzero(ids == TOMBSTONE)) / len(ids)
+
+    def compact(self):
+        """Rewrites both files without tombstoned rows"""
+        with self._lock:
+            ids, matrix = self.live()
+            self._drop_view()
+            tmp_vectors = self.vectors_path + ".tmp"
+            tmp_ids = self.ids_path + ".tmp"
+            with open(tmp_vectors, "wb") as f:
+                f.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(tmp_ids, "wb") as f:
+                f.write(ids.astype(np.int64).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_ids, self.ids_path)
+            with open(self.generation_path, "w") as f:
+                f.write(str(self.generation() + 1))
+            if self.compact_format:
+                self.build_compact()
+            print(f"Compacted embedding store {self.directory}: {len(ids)} live rows")
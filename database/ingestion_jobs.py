@@ -0,0 +1,109 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from database import database_manager
+import metrics
+
+INGESTION_WORKERS = 2
+ACTIVE_STATUSES = ('queued', 'running')
+
+_executor = ThreadPoolExecutor(max_workers=INGESTION_WORKERS, thread_name_prefix="ingestion")
+_submit_lock = threading.Lock()
+_resumed = False
+
+
+def submit_ingestion(project_id, file_name):
+    """Queues a PDF from the project's documents folder for background ingestion, returns the job id.
+
+    A file that already has a queued or running job is not queued twice.
+    """
+    with _submit_lock:
+        job_id = active_job(project_id, file_name)
+        if job_id is not None:
+            return job_id
+        with database_manager.connect() as conn:
+            c = conn.cursor()
+            c.execute("INSERT INTO ingestion_jobs (project_id, file_name) VALUES (?, ?)", (project_id, file_name))
+            job_id = c.lastrowid
+            conn.commit()
+    print(f"Queued ingestion job {job_id} for {file_name}")
+    _executor.submit(_run_job, job_id)
+    return job_id
+
+
+def active_job(project_id, file_name):
+    """Returns the id of the file's queued or running job, or None"""
+    with database_manager.connect() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT id FROM ingestion_jobs
+            WHERE project_id = ? AND file_name = ? AND status IN ({",".join("?" * len(ACTIVE_STATUSES))})
+        """, (project_id, file_name) + ACTIVE_STATUSES)
+        row = c.fetchone()
+        return row[0] if row else None
+
+
+def _update_job(job_id, **fields):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with database_manager.connect() as conn:
+        conn.execute(f"UPDATE ingestion_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                     tuple(fields.values()) + (job_id,))
+        conn.commit()
+
+
+def _run_job(job_id):
+    with database_manager.connect() as conn:
+        c = conn.cursor()
+        c.execute("SELECT project_id, file_name FROM ingestion_jobs WHERE id = ?", (job_id,))
+        row = c.fetchone()
+    if row is None:
+        return
+    project_id, file_name = row
+    _update_job(job_id, status='running', pages_processed=0, chunks_embedded=0, error=None)
+
+    def progress(pages_processed, chunks_embedded):
+        _update_job(job_id, pages_processed=pages_processed, chunks_embedded=chunks_embedded)
+
+    try:
+        with metrics.request(f"ingest {file_name}"):
+            document_id = database_manager.parse_insert_document(project_id, file_name, progress=progress)
+        _update_job(job_id, status='done', document_id=document_id)
+    except Exception as e:
+        print(f"Ingestion job {job_id} for {file_name} failed: {e}")
+        _update_job(job_id, status='failed', error=str(e))
+
+
+def get_jobs(project_id, active_only=False):
+    """Returns the project's jobs as dicts, newest first"""
+    query = """
+        SELECT id, file_name, status, pages_processed, chunks_embedded, error, updated_at
+        FROM ingestion_jobs WHERE project_id = ?
+    """
+    params = (project_id,)
+    if active_only:
+        query += f" AND status IN ({','.join('?' * len(ACTIVE_STATUSES))})"
+        params += ACTIVE_STATUSES
+    query += " ORDER BY id DESC"
+    with database_manager.connect() as conn:
+        c = conn.cursor()
+        c.execute(query, params)
+        columns = [column[0] for column in c.description]
+        return [dict(zip(columns, row)) for row in c.fetchall()]
+
+
+def resume_interrupted_jobs():
+    """Requeues jobs that were queued or running when the previous process stopped; runs once per process"""
+    global _resumed
+    with _submit_lock:
+        if _resumed:
+            return
+        _resumed = True
+    database_manager.prepare_documents_once()
+    with database_manager.connect() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT id, file_name FROM ingestion_jobs WHERE status IN ({','.join('?' * len(ACTIVE_STATUSES))}) ORDER BY id",
+                  ACTIVE_STATUSES)
+        jobs = c.fetchall()
+    for job_id, file_name in jobs:
+        print(f"Resuming ingestion job {job_id} for {file_name}")
+        _update_job(job_id, status='queued')
+        _executor.submit(_run_job, job_id)
@@ -0,0 +1,80 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import google.generativeai as genai
+
+# request limits of the Gemini batch embedding endpoint, with some headroom on the payload size
+MAX_BATCH_ITEMS = 100
+MAX_BATCH_BYTES = 1_000_000
+MAX_CONCURRENCY = 4
+MAX_RETRIES = 3
+RETRY_DELAY = 1.0
+
+
+class EmbeddingError(Exception):
+    """Raised when chunk embeddings could not be obtained"""
+
+
+class GeminiEmbeddingBackend:
+    """Embeds a batch of texts with one genai.embed_content call"""
+
+    def __init__(self, model, task_type=None):
+        self.model = model
+        self.task_type = task_type
+
+    def embed_batch(self, texts):
+        kwargs = {'model': self.model, 'content': texts}
+        if self.task_type:
+            kwargs['task_type'] = self.task_type
+        return genai.embed_content(**kwargs)['embedding']
+
+
+class EmbeddingDispatcher:
+    """Splits texts into request-sized batches, embeds them concurrently and returns the vectors in input order"""
+
+    def __init__(self, backend, max_batch_items=MAX_BATCH_ITEMS, max_batch_bytes=MAX_BATCH_BYTES,
+                 max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+        self.backend = backend
+        self.max_batch_items = max_batch_items
+        self.max_batch_bytes = max_batch_bytes
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def split(self, texts):
+        """Returns (start, end) ranges that respect the item-count and payload limits"""
+        batches = []
+        start = 0
+        size = 0
+        for i, text in enumerate(texts):
+            text_bytes = len(text.encode('utf-8'))
+            if i > start and (i - start >= self.max_batch_items or size + text_bytes > self.max_batch_bytes):
+                batches.append((start, i))
+                start, size = i, 0
+            size += text_bytes
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def _embed_with_retries(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                embeddings = self.backend.embed_batch(texts)
+                if len(embeddings) != len(texts):
+                    raise EmbeddingError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+                return embeddings
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise EmbeddingError(f"Embedding batch of {len(texts)} texts failed: {e}") from e
+                print(f"Embedding batch failed ({e}), retrying ({attempt + 1}/{self.max_retries})...")
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def embed(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        batches = self.split(texts)
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            results = [self._embed_with_retries(texts[start:end]) for start, end in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                results = list(pool.map(lambda batch: self._embed_with_retries(texts[batch[0]:batch[1]]), batches))
+        return [vector for batch in results for vector in batch]
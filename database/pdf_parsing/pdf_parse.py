@@ -6,7 +6,13 @@ import io
 import google.generativeai as genai
 import numpy as np
 import os
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
+from database.pdf_parsing.embedding_client import EmbeddingDispatcher, EmbeddingError, GeminiEmbeddingBackend
+import metrics
 
 load_dotenv()
 api_key = os.getenv("API_KEY")
@@ -14,13 +20,124 @@ genai.configure(api_key=api_key)
 
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
+EMBEDDING_MODEL = "models/embedding-001"
+QUERY_TASK_TYPE = "RETRIEVAL_QUERY"
+
+OCR_DPI = 300
+OCR_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+# pages read (and OCRed) together before their words are passed on
+PAGE_WINDOW = 16
+# chunks embedded and handed to the database together
+EMBED_BATCH_SIZE = 16
+# embedding batches requested concurrently while pages are still being read and earlier batches stored
+EMBED_WINDOW = 4
+
+# the PDF opened by each OCR worker process; never set in the app process, where ingestion jobs run side by side
+_ocr_document = None
+
+
+def _open_pdf(source):
+    """Opens a PDF from a file path or from raw bytes"""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def _init_ocr_worker(source, tesseract_cmd):
+    global _ocr_document
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    _ocr_document = _open_pdf(source)
+
+def _ocr_page_of(pdf_doc, page_index):
+    """Renders one page of an open PDF and runs tesseract on it, returns (page_index, text, seconds)"""
+    start = time.perf_counter()
+    pix = pdf_doc[page_index].get_pixmap(dpi=OCR_DPI)
+    img = Image.open(io.BytesIO(pix.tobytes("png")))
+    return page_index, pytesseract.image_to_string(img), time.perf_counter() - start
+
+def _ocr_page(page_index):
+    """Worker process task: OCRs one page of the PDF opened by _init_ocr_worker"""
+    return _ocr_page_of(_ocr_document, page_index)
+
+def _collect_ocr(results):
+    # pages are OCRed in worker processes, so their timings are recorded here
+    texts = {}
+    for page_index, text, seconds in results:
+        metrics.record("ocr_page", seconds)
+        texts[page_index] = text
+    return texts
+
+def _start_ocr_pool(source, workers):
+    # the pool is started from a thread of the (multi-threaded) Streamlit server, where a forked child can deadlock
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_ocr_worker,
+                               initargs=(source, pytesseract.pytesseract.tesseract_cmd))
+
+def ocr_pages(source, page_indexes, workers=OCR_WORKERS, pool=None):
+    """OCRs the given pages of a PDF (path or bytes), spreading them over a process pool, returns {page_index: text}"""
+    if not page_indexes:
+        return {}
+    if pool is not None:
+        return _collect_ocr(pool.map(_ocr_page, page_indexes))
+    if workers <= 1 or len(page_indexes) == 1:
+        with _open_pdf(source) as pdf_doc:
+            return _collect_ocr(_ocr_page_of(pdf_doc, i) for i in page_indexes)
+    with _start_ocr_pool(source, min(workers, len(page_indexes))) as pool:
+        return _collect_ocr(pool.map(_ocr_page, page_indexes))
+
+def iter_page_texts(source, workers=OCR_WORKERS):
+    """Yields (page_number, text) in page order; pages without a text layer are OCRed a window at a time"""
+    window = max(PAGE_WINDOW, 2 * workers)
+    pool = None
+    try:
+        with _open_pdf(source) as pdf_doc:
+            for start in range(0, len(pdf_doc), window):
+                with metrics.span("text_extraction"):
+                    texts = {i: pdf_doc[i].get_text() for i in range(start, min(start + window, len(pdf_doc)))}
+                scanned = [i for i, text in texts.items() if not text.strip()]
+                if scanned:
+                    print(f"{len(scanned)} pages without text from page {start + 1}, applying OCR...")
+                    if pool is None and workers > 1:
+                        pool = _start_ocr_pool(source, workers)
+                    texts.update(ocr_pages(source, scanned, workers=workers, pool=pool))
+                for i in sorted(texts):
+                    yield i + 1, texts[i]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def _report_pages(page_texts, on_page):
+    for page_number, text in page_texts:
+        on_page(page_number)
+        yield page_number, text
+
+def iter_chunks(page_texts, chunk_size=300):
+    """Groups the words of (page_number, text) pairs into chunks of chunk_size words, yields (text, first_page)"""
+    words = []
+    first_page = None
+    for page_number, text in page_texts:
+        page_words = text.split()
+        print(f"Page {page_number}: {len(page_words)} words")
+        pos = 0
+        while pos < len(page_words):
+            if not words:
+                first_page = page_number
+            take = chunk_size - len(words)
+            words.extend(page_words[pos:pos + take])
+            pos += take
+            if len(words) == chunk_size:
+                yield " ".join(words), first_page
+                words = []
+    if words:
+        yield " ".join(words), first_page
+
 def retrieve_question_answer(question):
     try:
-        response = genai.embed_content(
-            model="models/embedding-001",
-            content=question,
-            task_type="RETRIEVAL_QUERY"
-        )
+        with metrics.span("query_embedding"):
+            response = genai.embed_content(
+                model=EMBEDDING_MODEL,
+                content=question,
+                task_type=QUERY_TASK_TYPE
+            )
         question_vector = response['embedding']
         print(f"Question vector: {question_vector}")
         return question_vector
@@ -30,8 +147,13 @@ def retrieve_question_answer(question):
         return None
 
 class PDFParser:
-    def __init__(self):
+    def __init__(self, embedding_cache=None, ocr_workers=OCR_WORKERS, dispatcher=None):
         self.parsing_thread = None
+        self.ocr_workers = ocr_workers
+        # batches, parallelises and retries embedding requests; swap its backend to benchmark offline
+        self.dispatcher = dispatcher or EmbeddingDispatcher(GeminiEmbeddingBackend(EMBEDDING_MODEL))
+        # optional ChunkEmbeddingCache, lets re-uploaded text skip the embedding call
+        self.embedding_cache = embedding_cache
         # self.model = genai.TextEmbeddingModel(model_name="models/embedding-001")
         # self.client = genai.Client(api_key='apikey')
         self.last_ve = None
@@ -46,36 +168,11 @@ class PDFParser:
         return ve
 
     def chunk_pdf_whole(self, doc, chunk_size=300):
-        word_tuples = []
-        file_bytes = doc.read()
-        if file_bytes:
-            with fitz.open(stream=file_bytes, filetype="pdf") as pdf_doc:
-                for i, page in enumerate(pdf_doc):
-                    text = page.get_text()
-                    if not text.strip():
-                        print(f"Page {i + 1}: No text found, applying OCR...")
-                        pix = page.get_pixmap(dpi=300)
-                        img_bytes = pix.tobytes("png")
-                        img = Image.open(io.BytesIO(img_bytes))
-                        text = pytesseract.image_to_string(img)
-                    else:
-                        print(f"Page {i + 1}: Extracted text with get_text()")
-
-                    words = text.split()
-                    word_tuples.extend([(word, i + 1) for word in words])
-                    print(f"Page {i + 1}: {len(words)} words")
-
-        chunks = []
-        for i in range(0, len(word_tuples), chunk_size):
-            chunk = word_tuples[i:i + chunk_size]
-            if not chunk:
-                break
-            chunk_text = " ".join(word for word, _ in chunk)
-            first_page = chunk[0][1]
-            print(f"Chunk {len(chunks) + 1}: {len(chunk)} words, Page {first_page}")
-            chunks.append((chunk_text, first_page))
-
-        return chunks
+        """Returns all (text, first_page) chunks of a PDF given as a path or an open file"""
+        source = doc.read() if hasattr(doc, 'read') else doc
+        if not source:
+            return []
+        return list(iter_chunks(iter_page_texts(source, self.ocr_workers), chunk_size))
     # def embed_chunk(self, chunk):
     #     response = self.client.models.embed_content(model="gemini-embedding-exp-03-07", contents=chunk, config=types.EmbedContentConfig(
     #           task_type="RETRIEVAL_DOCUMENT",
@@ -86,27 +183,80 @@ class PDFParser:
     def embed_chunk(self, chunk):
         """Embeds text using the Gemini embedding model"""
         try:
-            response = genai.embed_content(
-                model="models/embedding-001",
-                content=chunk
-            )
-            return response['embedding']
-        except Exception as e:
+            with metrics.span("embedding"):
+                return self.dispatcher.embed(chunk)
+        except EmbeddingError as e:
             print(f"Error embedding text: {e}")
             return None
 
+    def embed_texts(self, texts):
+        """Embeds a list of chunk texts, only sending the ones missing from the embedding cache"""
+        if self.embedding_cache is None:
+            return self.embed_chunk(texts)
+        embeddings = self.embedding_cache.get_many(EMBEDDING_MODEL, texts)
+        missing = [i for i in range(len(texts)) if i not in embeddings]
+        print(f"Embedding cache: {len(embeddings)} hits, {len(missing)} misses")
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new_embeddings = self.embed_chunk(missing_texts)
+            if new_embeddings is None:
+                return None
+            self.embedding_cache.put_many(EMBEDDING_MODEL, missing_texts, new_embeddings)
+            embeddings.update(zip(missing, new_embeddings))
+        return [embeddings[i] for i in range(len(texts))]
+
+    def iter_vector_entry_batches(self, source, chunk_size=1600, batch_size=EMBED_BATCH_SIZE, on_page=None):
+        """Streams a PDF (path or bytes) through page -> words -> chunk -> embedding, yielding lists of vector entries.
+
+        on_page(page_number) is called as each page's text becomes available. Up to EMBED_WINDOW batches
+        are embedded concurrently; they are still yielded in chunk order.
+        """
+        batch = []
+        chunk_index = 0
+        pending = deque()
+        pages = iter_page_texts(source, self.ocr_workers)
+        if on_page is not None:
+            pages = _report_pages(pages, on_page)
+        # the embedding spans of the pool threads belong to the caller's request
+        embed_batch = metrics.bind(self._embed_batch)
+        with ThreadPoolExecutor(max_workers=EMBED_WINDOW, thread_name_prefix="embedding") as pool:
+            try:
+                for chunk in iter_chunks(pages, chunk_size):
+                    batch.append(chunk)
+                    if len(batch) == batch_size:
+                        pending.append(pool.submit(embed_batch, batch, chunk_index))
+                        chunk_index += len(batch)
+                        batch = []
+                        if len(pending) >= EMBED_WINDOW:
+                            yield pending.popleft().result()
+                if batch:
+                    pending.append(pool.submit(embed_batch, batch, chunk_index))
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # a failed batch or an abandoned generator leaves no requests queued behind it
+                for future in pending:
+                    future.cancel()
+
+    def _embed_batch(self, chunks, first_index):
+        texts = [text for text, _ in chunks]
+        embeddings = self.embed_texts(texts)
+        if embeddings is None:
+            raise EmbeddingError(f"Could not embed chunks {first_index}-{first_index + len(chunks) - 1}")
+        return [{'text': text, 'page': page, 'vector': np.array(embedding, dtype=np.float32), 'chunk_index': first_index + i}
+                for i, ((text, page), embedding) in enumerate(zip(chunks, embeddings))]
+
     def create_vector_entries(self, pdf_document):
-        chunks = self.chunk_pdf_whole(pdf_document, chunk_size=1600)
+        source = pdf_document.read() if hasattr(pdf_document, 'read') else pdf_document
+        if not source:
+            return []
         vector_entries = []
-        i = 0
-        tries = 0
-        text_chunks = [chunk[0] for chunk in chunks]
-        pages = [chunk[1] for chunk in chunks]
-        embeddings = self.embed_chunk(text_chunks)
-        for i in range(len(chunks)):
-            vector_entry = {'text': text_chunks[i], 'page': pages[i], 'vector': np.array(embeddings[i]), 'chunk_index': i}
-            vector_entries.append(vector_entry)
-            print(vector_entry)
+        try:
+            for batch in self.iter_vector_entry_batches(source):
+                vector_entries.extend(batch)
+        except EmbeddingError as e:
+            print(f"Error creating vector entries: {e}")
+            return None
         return vector_entries
 
 
@@ -0,0 +1,54 @@
+"""Builds compact float16/int8 copies of every project's embeddings and reports recall and bytes scanned.
+
+Usage (from the repository root):
+    python -m database.quantize_embeddings int8 [top_k] [num_queries]
+
+Set EMBEDDING_STORAGE to the same format (e.g. in .env) to search with the compact copies.
+"""
+import sys
+import numpy as np
+from database import database_manager
+
+
+def measure_quantization_recall(project_id, num_queries=50, top_k=5, seed=0):
+    """Returns (recall without rescoring, recall with rescoring) of compact search against float32 search"""
+    _, matrix = database_manager.load_project_matrix(project_id)
+    if len(matrix) == 0:
+        return 1.0, 1.0
+    rng = np.random.default_rng(seed)
+    queries = matrix[rng.choice(len(matrix), min(num_queries, len(matrix)), replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+    store = database_manager.get_embedding_store(project_id)
+    compact_format = store.compact_format
+    raw, rescored = [], []
+    for query in queries:
+        store.compact_format = None
+        exact_ids = {chunk_id for _, chunk_id in database_manager.vector_top_scores(query, project_id, top_k)}
+        store.compact_format = compact_format
+        raw_ids = {chunk_id for _, chunk_id in database_manager.vector_top_scores(query, project_id, top_k, rescore=False)}
+        rescored_ids = {chunk_id for _, chunk_id in database_manager.vector_top_scores(query, project_id, top_k)}
+        raw.append(len(exact_ids & raw_ids) / len(exact_ids))
+        rescored.append(len(exact_ids & rescored_ids) / len(exact_ids))
+    return float(np.mean(raw)), float(np.mean(rescored))
+
+
+def convert_all(compact_format, top_k=5, num_queries=50):
+    database_manager.EMBEDDING_STORAGE = compact_format
+    database_manager._embedding_stores.clear()
+    for project_id, name, *_ in database_manager.get_all_projects():
+        store = database_manager.get_embedding_store(project_id)
+        store.build_compact()
+        full, compact = store.nbytes()
+        raw, rescored = measure_quantization_recall(project_id, num_queries=num_queries, top_k=top_k)
+        # the compact copy is kept in addition to embeddings.f32, which rescoring still reads
+        fewer = 1 - compact / full if full else 0.0
+        print(f"{name}: scanned per query {full / 2**20:.1f} MB float32 -> {compact / 2**20:.1f} MB {compact_format} "
+              f"({fewer:.0%} fewer bytes), on disk {(full + compact) / 2**20:.1f} MB in total, "
+              f"recall@{top_k} {raw:.3f} compact only, {rescored:.3f} rescored")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("float16", "int8"):
+        print(__doc__)
+        sys.exit(1)
+    convert_all(sys.argv[1], *(int(arg) for arg in sys.argv[2:4]))
@@ -0,0 +1,156 @@
+"""Per-project bank of generated quiz questions.
+
+Quizzes are sampled from the bank, least served questions first, so a click on "Generate New Quiz"
+normally needs no LLM call. When a topic/difficulty has fewer than REFILL_THRESHOLD unserved
+questions a background refill generates another batch from a random subset of the topic's best
+matching chunks. Questions already in the project's bank are skipped, and a question stops being
+served once all chunks it was generated from have been deleted.
+"""
+import hashlib
+import json
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from database import database_manager
+from database.embedding_cache import normalize_text
+import metrics
+
+REFILL_THRESHOLD = 10
+REFILL_BATCH = 10
+# each batch is generated from CONTEXT_CHUNKS of the topic's CONTEXT_CANDIDATES best chunks so batches differ
+CONTEXT_CANDIDATES = 40
+CONTEXT_CHUNKS = 15
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quiz-bank")
+_refill_lock = threading.Lock()
+_refilling = set()
+
+_LIVE = "EXISTS (SELECT 1 FROM quiz_question_chunks qc WHERE qc.question_id = q.id)"
+
+
+def question_hash(question):
+    return hashlib.sha256(normalize_text(question).encode('utf-8')).hexdigest()
+
+
+def add_questions(project_id, topic, difficulty, questions, chunk_ids):
+    """Stores generated questions with the chunks they came from, returns the ones that were new"""
+    topic = normalize_text(topic)
+    chunk_ids = [int(chunk_id) for chunk_id in chunk_ids]
+    added = []
+    with database_manager.connect() as conn:
+        c = conn.cursor()
+        for question in questions:
+            c.execute("""
+                INSERT OR IGNORE INTO quiz_questions (project_id, topic, difficulty, question, options, answer, question_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (project_id, topic, difficulty, question['question'], json.dumps(question['options']),
+                  question['answer'], question_hash(question['question'])))
+            if not c.rowcount:
+                continue
+            question_id = c.lastrowid
+            # chunks deleted since retrieval are skipped instead of failing the foreign key
+            c.execute(f"""
+                INSERT INTO quiz_question_chunks (question_id, chunk_id)
+                SELECT ?, id FROM text_chunks WHERE id IN ({",".join("?" * len(chunk_ids))})
+            """, [question_id] + chunk_ids)
+            added.append(dict(question, id=question_id))
+        conn.commit()
+    return added
+
+
+def count_unserved(project_id, topic, difficulty):
+    with database_manager.connect() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT COUNT(*) FROM quiz_questions q
+            WHERE project_id = ? AND topic = ? AND difficulty = ? AND served_count = 0 AND {_LIVE}
+        """, (project_id, normalize_text(topic), difficulty))
+        return c.fetchone()[0]
+
+
+def sample_questions(project_id, topic, difficulty, num_questions, exclude_ids=()):
+    """Draws up to num_questions questions, least served first, and counts them as served"""
+    exclude_ids = [int(question_id) for question_id in exclude_ids]
+    with database_manager.connect() as conn:
+        c = conn.cursor()
+        c.execute(f"""
+            SELECT id, question, options, answer FROM quiz_questions q
+            WHERE project_id = ? AND topic = ? AND difficulty = ? AND {_LIVE}
+              AND id NOT IN ({",".join("?" * len(exclude_ids))})
+            ORDER BY served_count, RANDOM()
+            LIMIT ?
+        """, [project_id, normalize_text(topic), difficulty] + exclude_ids + [num_questions])
+        rows = c.fetchall()
+        c.executemany("UPDATE quiz_questions SET served_count = served_count + 1 WHERE id = ?",
+                      [(row[0],) for row in rows])
+        conn.commit()
+    questions = [{'id': question_id, 'question': question, 'options': json.loads(options), 'answer': answer}
+                 for question_id, question, options, answer in rows]
+    random.shuffle(questions)
+    return questions
+
+
+def fill(project_id, topic, difficulty, generate, num_questions=REFILL_BATCH, on_question=None):
+    """Generates one batch into the bank, returns the new questions.
+
+    `generate(context, num_questions, difficulty)` yields question dictionaries; each new one is
+    stored as soon as it arrives and passed to `on_question`.
+    """
+    _, chunks = database_manager.get_RAG_context(topic, project_id, top_k=CONTEXT_CANDIDATES)
+    if len(chunks) > CONTEXT_CHUNKS:
+        # keep the retrieval order so the best matches stay inside the prompt's text limit
+        chunks = [chunks[i] for i in sorted(random.sample(range(len(chunks)), CONTEXT_CHUNKS))]
+    if not chunks:
+        return []
+    context = ' '.join([chunk[3] for chunk in chunks])
+    chunk_ids = [chunk[1] for chunk in chunks]
+    added = []
+    for question in generate(context, num_questions, difficulty):
+        for new_question in add_questions(project_id, topic, difficulty, [question], chunk_ids):
+            added.append(new_question)
+            if on_question:
+                on_question(new_question)
+    print(f"Quiz bank: added {len(added)} {difficulty} questions on '{topic}' to project {project_id}")
+    return added
+
+
+def request_refill(project_id, topic, difficulty, generate):
+    """Queues a background batch for the topic/difficulty unless one is already queued or running"""
+    key = (project_id, normalize_text(topic), difficulty)
+    with _refill_lock:
+        if key in _refilling:
+            return False
+        _refilling.add(key)
+    _executor.submit(_refill, key, generate)
+    return True
+
+
+def _refill(key, generate):
+    project_id, topic, difficulty = key
+    try:
+        with metrics.request(f"quiz refill {topic}"):
+            if count_unserved(project_id, topic, difficulty) < REFILL_THRESHOLD:
+                fill(project_id, topic, difficulty, generate)
+    except Exception as e:
+        print(f"Quiz bank refill for '{topic}' failed: {e}")
+    finally:
+        with _refill_lock:
+            _refilling.discard(key)
+
+
+def serve_quiz(project_id, topic, difficulty, num_questions, generate, on_question=None):
+    """Returns num_questions questions for the topic, generating synchronously only what the bank lacks.
+
+    Afterwards a background refill is queued if the topic/difficulty is running low.
+    """
+    topic = normalize_text(topic)
+    questions = sample_questions(project_id, topic, difficulty, num_questions)
+    if len(questions) < num_questions:
+        missing = num_questions - len(questions)
+        added = fill(project_id, topic, difficulty, generate, num_questions=missing, on_question=on_question)
+        if added:
+            questions += sample_questions(project_id, topic, difficulty, missing,
+                                          exclude_ids=[question['id'] for question in questions])
+    if count_unserved(project_id, topic, difficulty) < REFILL_THRESHOLD:
+        request_refill(project_id, topic, difficulty, generate)
+    return questions
@@ -0,0 +1,153 @@
+"""Per-project queue of generated flashcard candidates.
+
+Candidates are generated BATCH_SIZE at a time and kept in the project's flashcards/queue.json, so
+Generate and Regenerate pop a card without waiting for Gemini. Each pop queues a background refill
+when the queue has dropped below REFILL_THRESHOLD; a pop only waits for a batch when the queue is empty. Candidates that nearly duplicate an approved card or one
+already queued are dropped.
+"""
+import difflib
+import json
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from database import database_manager
+from database.embedding_cache import normalize_text
+import pdf_handler
+import metrics
+
+BATCH_SIZE = 10
+REFILL_THRESHOLD = 3
+# difflib ratio between whole cards (front and back) at or above which a candidate counts as a duplicate;
+# fronts alone are too short, e.g. "What is mitosis?" and "What is meiosis?" score 0.94
+DUPLICATE_RATIO = 0.85
+CONTEXT_TOPIC = "General"
+# each batch is generated from CONTEXT_CHUNKS of the CONTEXT_CANDIDATES best chunks so batches differ
+CONTEXT_CANDIDATES = 40
+CONTEXT_CHUNKS = 15
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="flashcards")
+# guards reads and writes of the queue files
+_queue_lock = threading.Lock()
+_refill_lock = threading.Lock()
+_refilling = set()
+
+
+def queue_path(project_path):
+    return os.path.join(project_path, "flashcards", "queue.json")
+
+
+def approved_path(project_path):
+    return os.path.join(project_path, "flashcards", "approved.json")
+
+
+def _read_cards(path):
+    try:
+        with open(path) as f:
+            cards = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return cards if isinstance(cards, list) else []
+
+
+def _write_cards(path, cards):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(cards, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def card_text(card):
+    return normalize_text(f"{card.get('front', '')} {card.get('back', '')}")
+
+
+def is_duplicate(card, cards, ratio=DUPLICATE_RATIO):
+    """True if the card is at least `ratio` similar to any of `cards`"""
+    matcher = difflib.SequenceMatcher(b=card_text(card))
+    for other in cards:
+        matcher.set_seq1(card_text(other))
+        # real_quick_ratio and quick_ratio are upper bounds of ratio, so most pairs are rejected cheaply
+        if matcher.real_quick_ratio() >= ratio and matcher.quick_ratio() >= ratio and matcher.ratio() >= ratio:
+            return True
+    return False
+
+
+def filter_candidates(candidates, approved, queued):
+    """Well-formed candidates that duplicate neither an approved card, a queued card nor each other"""
+    accepted = []
+    for card in candidates:
+        if not isinstance(card, dict) or not isinstance(card.get('front'), str) or not isinstance(card.get('back'), str):
+            continue
+        if not card['front'].strip() or is_duplicate(card, approved) or is_duplicate(card, queued + accepted):
+            continue
+        accepted.append({'front': card['front'], 'back': card['back']})
+    return accepted
+
+
+def fill(project_id, project_path, num_cards=BATCH_SIZE):
+    """Generates one batch of candidates into the queue, returns how many were kept"""
+    _, chunks = database_manager.get_RAG_context(CONTEXT_TOPIC, project_id, top_k=CONTEXT_CANDIDATES)
+    if len(chunks) > CONTEXT_CHUNKS:
+        chunks = [chunks[i] for i in sorted(random.sample(range(len(chunks)), CONTEXT_CHUNKS))]
+    if not chunks:
+        return 0
+    context = ' '.join([chunk[3] for chunk in chunks])
+    candidates = pdf_handler.parse_flashcards(pdf_handler.generate_flashcards(context, num_cards=num_cards))
+    with _queue_lock:
+        queued = _read_cards(queue_path(project_path))
+        accepted = filter_candidates(candidates, _read_cards(approved_path(project_path)), queued)
+        _write_cards(queue_path(project_path), queued + accepted)
+    print(f"Flashcard queue: kept {len(accepted)} of {len(candidates)} generated cards for project {project_id}")
+    return len(accepted)
+
+
+def request_refill(project_id, project_path):
+    """Queues a background batch if the project's queue is low and no refill is queued or running"""
+    with _refill_lock:
+        if project_id in _refilling:
+            return False
+        with _queue_lock:
+            if len(_read_cards(queue_path(project_path))) >= REFILL_THRESHOLD:
+                return False
+        _refilling.add(project_id)
+    _executor.submit(_refill, project_id, project_path)
+    return True
+
+
+def _refill(project_id, project_path):
+    try:
+        with metrics.request("flashcard refill"):
+            fill(project_id, project_path)
+    except Exception as e:
+        print(f"Flashcard queue refill for project {project_id} failed: {e}")
+    finally:
+        with _refill_lock:
+            _refilling.discard(project_id)
+
+
+def pop_card(project_id, project_path):
+    """Takes the next candidate that does not duplicate an approved card, or None if none could be generated.
+
+    Only an empty queue makes the caller wait for a batch; afterwards a refill is requested if the queue is low.
+    """
+    card = _pop_queued(project_path)
+    if card is None:
+        fill(project_id, project_path)
+        card = _pop_queued(project_path)
+    request_refill(project_id, project_path)
+    return card
+
+
+def _pop_queued(project_path):
+    with _queue_lock:
+        queued = _read_cards(queue_path(project_path))
+        approved = _read_cards(approved_path(project_path))
+        # cards approved since a candidate was queued can turn it into a duplicate
+        while queued:
+            card = queued.pop(0)
+            if not is_duplicate(card, approved):
+                _write_cards(queue_path(project_path), queued)
+                return card
+        _write_cards(queue_path(project_path), queued)
+        return None
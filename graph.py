@@ -1,127 +1,332 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import networkx as nx
 import matplotlib.pyplot as plt
+import hashlib
+import io
 import json
+import os
 import re
-from client import model  
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from client import stream_pieces
 
-def initialize_mindmap(base_context, json_save_path):
-    """Initialize mind map based on the selected PDF using Gemini"""
-    prompt = base_context + f"""
+# vis-network based view that runs in the browser, see mindmap_component/index.html
+_mindmap_component = components.declare_component(
+    "mindmap", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "mindmap_component"))
 
+# lazy maps stop offering expansions below this depth (root = 0)
+LAZY_MAX_DEPTH = 3
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mindmap-prefetch")
+# (json_path, created_at, node_id) -> Future of an expansion that is generated or being generated;
+# only the current map's entries are kept, at most PREFETCH_MAX_ENTRIES of them
+PREFETCH_MAX_ENTRIES = 16
+_prefetched = {}
+_prefetch_lock = threading.Lock()
+
+def partial_labels(text):
+    """Node labels found so far in a mind map response that is still streaming"""
+    return re.findall(r'"label"\s*:\s*"([^"]+)"', text)
+
+MINDMAP_JSON_FORMAT = """
     Return the structure as JSON with:
-    {{
+    {
         "nodes": [
-            {{
+            {
                 "id": "unique_id_1",
                 "label": "Main Concept 1",
                 "size": 2,
                 "color": "#6a9df6",
                 "description": "Detailed explanation..."
-            }}
+            }
         ],
         "edges": [
-            {{
+            {
                 "source": "source_node_id",
                 "target": "target_node_id",
                 "relation": "relationship_type"
-            }}
+            }
         ]
-    }}
+    }
+"""
+
+def mindmap_prompt(base_context, lazy=False):
+    """Adds the JSON format instructions to the RAG context of a mind map"""
+    if lazy:
+        return base_context + MINDMAP_JSON_FORMAT + """
+    Include one root node for the topic and 5-7 main nodes connected to it, without subnodes;
+    subnodes are generated later.
+    Ensure all node labels are unique and don't contain special characters.
+    """
+    return base_context + MINDMAP_JSON_FORMAT + """
     Include 5-7 main nodes and 2-3 subnodes for each.
     Make the structure hierarchical and meaningful.
     Ensure all node labels are unique and don't contain special characters.
     """
 
+def expansion_prompt(context, topic, label, description, existing_labels):
+    """Prompt for the subnodes of one node of a lazy map"""
+    return f"""Based on this context: {context}
+     In a mind map about {topic}, the concept "{label}" is described as: {description}
+     Create 2-3 subnodes that break "{label}" down further.""" + MINDMAP_JSON_FORMAT + f"""
+    Only return the new subnodes and the edges from "{label}" to them.
+    Ensure the labels don't contain special characters and differ from these existing labels: {", ".join(existing_labels)}
+    """
+
+def _add_mindmap_node(G, node):
+    label = node['label'].strip()
+    G.add_node(
+        label,
+        size=node.get('size', 1) * 1500,
+        color=node.get('color', '#6a9df6'),
+        description=node.get('description', 'No description available')
+    )
+    return label
+
+def build_mindmap_graph(graph_data):
+    """Builds the DiGraph of a mind map JSON, resolving edge endpoints through an id -> label index"""
+    G = nx.DiGraph()
+    labels = {}
+    for node in graph_data['nodes']:
+        labels[node['id']] = _add_mindmap_node(G, node)
+    for edge in graph_data['edges']:
+        source = labels.get(edge['source'])
+        target = labels.get(edge['target'])
+        if source in G and target in G:
+            G.add_edge(source, target, relation=edge.get('relation', 'related'))
+    return G
+
+def set_mindmap(G, topic=None, fingerprint=None, graph_data=None, json_path=None):
+    """Makes G the mind map shown in the session"""
+    root_node = list(G.nodes())[0] 
+    children, parents = build_tree_index(G)
+    graph_data = graph_data or {}
+
+    st.session_state.mindmap = {
+        'graph': G,
+        'topic': topic,
+        'fingerprint': fingerprint,
+        'lazy': graph_data.get('lazy', False),
+        'graph_data': graph_data,
+        'json_path': json_path,
+        'node_ids': {node['label'].strip(): node['id'] for node in graph_data.get('nodes', [])},
+        'children': children,
+        'parents': parents,
+        'root': root_node,
+        'initial_root': root_node,
+        'current_focus': root_node,
+        'visible_nodes': set(G.nodes()),
+        'selected_node': None,
+        'history': []
+    }
+
+def mindmap_is_current(topic, fingerprint, lazy=False):
+    """True if the session already shows the map of this topic built from the same documents"""
+    mindmap = st.session_state.get('mindmap') or {}
+    return (mindmap.get('graph') is not None and mindmap.get('topic') == topic
+            and mindmap.get('fingerprint') == fingerprint and mindmap.get('lazy', False) == lazy)
+
+def load_mindmap(json_path, fingerprint, topic=None, lazy=False):
+    """Shows the map saved at json_path if it was generated from the same documents, returns its graph or None"""
+    if not os.path.exists(json_path):
+        return None
     try:
-        response = model.generate_content(prompt)
-        json_str = re.search(r'\{.*\}', response.text, re.DOTALL).group()
-        graph_data = json.loads(json_str)
-        with open(json_save_path, 'w') as f:
-            json.dump(graph_data, f, indent=4)
-        G = nx.DiGraph()
-        for node in graph_data['nodes']:
-            label = node['label'].strip()
-            G.add_node(
-                label,
-                size=node.get('size', 1) * 1500,
-                color=node.get('color', '#6a9df6'),
-                description=node.get('description', 'No description available')
-            )
-        for edge in graph_data['edges']:
-            source = next(n['label'].strip() for n in graph_data['nodes'] if n['id'] == edge['source'])
-            target = next(n['label'].strip() for n in graph_data['nodes'] if n['id'] == edge['target'])
-            if source in G and target in G:
-                G.add_edge(source, target, relation=edge.get('relation', 'related'))
-        root_node = list(G.nodes())[0] 
-
-        st.session_state.mindmap = {
-            'graph': G,
-            'root': root_node,
-            'initial_root': root_node,
-            'current_focus': root_node,
-            'visible_nodes': set(G.nodes()),
-            'selected_node': None,
-            'history': []
-        }
+        with open(json_path) as f:
+            graph_data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if fingerprint is None or graph_data.get('fingerprint') != fingerprint or graph_data.get('lazy', False) != lazy:
+        return None
+    G = build_mindmap_graph(graph_data)
+    if not G.nodes():
+        return None
+    set_mindmap(G, topic, fingerprint, graph_data, json_path)
+    return G
+
+def save_mindmap_data(graph_data, json_path):
+    with open(json_path, 'w') as f:
+        json.dump(graph_data, f, indent=4)
+
+def initialize_mindmap(base_context, json_save_path, on_text=None, topic=None, fingerprint=None, lazy=False):
+    """Initialize mind map based on the selected PDF using Gemini.
 
+    The response is streamed; on_text(text_so_far) is called for every piece that arrives.
+    The map is saved with its topic and document fingerprint so load_mindmap can reuse it.
+    A lazy map only has the top level; expand_node adds the subnodes of a node later.
+    """
+    try:
+        response_text = ""
+        for piece in stream_pieces(mindmap_prompt(base_context, lazy)):
+            response_text += piece
+            if on_text:
+                on_text(response_text)
+        json_str = re.search(r'\{.*\}', response_text, re.DOTALL).group()
+        graph_data = json.loads(json_str)
+        graph_data['topic'] = topic
+        graph_data['fingerprint'] = fingerprint
+        graph_data['created_at'] = time.time()
+        if lazy:
+            graph_data['lazy'] = True
+            graph_data['expanded'] = [graph_data['nodes'][0]['id']] if graph_data['nodes'] else []
+        save_mindmap_data(graph_data, json_save_path)
+        G = build_mindmap_graph(graph_data)
+        set_mindmap(G, topic, fingerprint, graph_data, json_save_path)
         return G
 
     except Exception as e:
         st.error(f"Mind map creation failed: {str(e)}")
         return None
 
-def get_subgraph(G, root_node):
+def node_depth(mindmap, label):
+    depth = 0
+    seen = {label}
+    parents = mindmap['parents'].get(label, [])
+    while parents and parents[0] not in seen:
+        seen.add(parents[0])
+        depth += 1
+        parents = mindmap['parents'].get(parents[0], [])
+    return depth
+
+def can_expand(mindmap, label):
+    """True for a node of a lazy map whose subnodes have not been generated yet"""
+    if not mindmap.get('lazy') or label not in mindmap.get('node_ids', {}):
+        return False
+    return (mindmap['node_ids'][label] not in mindmap['graph_data'].get('expanded', [])
+            and node_depth(mindmap, label) < LAZY_MAX_DEPTH)
+
+def generate_expansion(context_fn, topic, label, description, existing_labels):
+    """Asks Gemini for the subnodes of one node, with a RAG context retrieved for that node"""
+    context = context_fn(f"{topic}: {label}")
+    response_text = "".join(stream_pieces(expansion_prompt(context, topic, label, description, existing_labels)))
+    return json.loads(re.search(r'\{.*\}', response_text, re.DOTALL).group())
+
+def _expansion_future(mindmap, label, context_fn):
+    key = (mindmap['json_path'], mindmap['graph_data'].get('created_at'), mindmap['node_ids'][label])
+    with _prefetch_lock:
+        future = _prefetched.get(key)
+        if future is None:
+            # expansions of another map, or the oldest ones of this map, will not be asked for anymore
+            for stale_key in [k for k in _prefetched if k[:2] != key[:2]]:
+                _prefetched.pop(stale_key).cancel()
+            while len(_prefetched) >= PREFETCH_MAX_ENTRIES:
+                _prefetched.pop(next(iter(_prefetched))).cancel()
+            description = mindmap['graph'].nodes[label].get('description', '')
+            future = _prefetch_executor.submit(generate_expansion, context_fn, mindmap['topic'], label, description,
+                                               list(mindmap['graph'].nodes()))
+            _prefetched[key] = future
+    return key, future
+
+def prefetch_expansions(labels, context_fn):
+    """Starts generating the subnodes of the given nodes in the background"""
+    mindmap = st.session_state.get('mindmap') or {}
+    for label in labels:
+        if can_expand(mindmap, label):
+            _expansion_future(mindmap, label, context_fn)
+
+def merge_expansion(mindmap, label, expansion):
+    """Adds generated subnodes under label, saves the map JSON and drops the cached views"""
+    G = mindmap['graph']
+    graph_data = mindmap['graph_data']
+    parent_id = mindmap['node_ids'][label]
+    relations = {edge.get('target'): edge.get('relation', 'contains') for edge in expansion.get('edges', [])}
+    for node in expansion.get('nodes', []):
+        child_label = str(node.get('label', '')).strip()
+        if not child_label or child_label in G:
+            continue
+        child_id = f"{parent_id}/{node.get('id', child_label)}"
+        relation = relations.get(node.get('id'), 'contains')
+        graph_data['nodes'].append(dict(node, id=child_id, label=child_label))
+        graph_data['edges'].append({'source': parent_id, 'target': child_id, 'relation': relation})
+        _add_mindmap_node(G, node)
+        G.add_edge(label, child_label, relation=relation)
+        mindmap['node_ids'][child_label] = child_id
+    graph_data.setdefault('expanded', []).append(parent_id)
+    if mindmap.get('json_path'):
+        save_mindmap_data(graph_data, mindmap['json_path'])
+    mindmap['children'], mindmap['parents'] = build_tree_index(G)
+    mindmap['visible_nodes'] = set(G.nodes())
+    for key in ('views', 'positions', 'images', 'client_graph'):
+        mindmap.pop(key, None)
+
+def expand_node(label, context_fn):
+    """Generates (or takes the prefetched) subnodes of label in the session's lazy map, returns True if it grew"""
+    mindmap = st.session_state.get('mindmap') or {}
+    if not can_expand(mindmap, label):
+        return False
+    key, future = _expansion_future(mindmap, label, context_fn)
+    try:
+        expansion = future.result()
+    except Exception as e:
+        st.error(f"Expanding {label} failed: {str(e)}")
+        return False
+    finally:
+        with _prefetch_lock:
+            _prefetched.pop(key, None)
+    merge_expansion(mindmap, label, expansion)
+    return True
+
+EDGE_STYLES = {
+    'contains': {'style': 'dashed', 'width': 2, 'color': '#6c757d'},
+    'related': {'style': 'solid', 'width': 1.5, 'color': '#495057'},
+    'influences': {'style': 'solid', 'width': 2, 'color': '#2b8a3e', 'alpha': 0.8}
+}
+
+def build_tree_index(G):
+    """Returns (children, parents) lists of every node, so subtree lookups do not walk the graph again"""
+    children = {node: list(G.successors(node)) for node in G}
+    parents = {node: list(G.predecessors(node)) for node in G}
+    return children, parents
+
+def get_subgraph(G, root_node, children=None, parents=None):
     """Get subgraph starting from root_node with safety checks"""
     if root_node not in G:
         if not G.nodes():
             return G
         root_node = list(G.nodes())[0]
+    if children is None or parents is None:
+        children, parents = build_tree_index(G)
 
-    nodes = set()
-    nodes.add(root_node)
-
-    try:
-        for successor in nx.dfs_preorder_nodes(G, root_node):
-            nodes.add(successor)
-    except nx.NetworkXError:
-        nodes.add(root_node)
-
-    for predecessor in G.predecessors(root_node):
-        nodes.add(predecessor)
+    nodes = {root_node}
+    stack = [root_node]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            if child not in nodes:
+                nodes.add(child)
+                stack.append(child)
+    nodes.update(parents.get(root_node, []))
 
     return G.subgraph(nodes)
 
+def get_focus_view(mindmap):
+    """Returns (subgraph, positions) for the current focus node, cached per focus in the mind map state.
 
-def draw_interactive_mindmap():
-    """Draw interactive mind map with navigation using Streamlit components"""
-    if 'mindmap' not in st.session_state or not st.session_state.mindmap['graph']:
-        return
-
-    G = st.session_state.mindmap['graph']
-    current_root = st.session_state.mindmap['current_focus']
-    try:
-        subG = get_subgraph(G, current_root)
-    except:
-        subG = G
+    Positions come from one spring layout of the whole graph, so focusing a node keeps its place.
+    """
+    G = mindmap['graph']
+    focus = mindmap['current_focus']
+    views = mindmap.setdefault('views', {})
+    if focus not in views:
+        if 'positions' not in mindmap:
+            mindmap['positions'] = nx.spring_layout(G, k=1.5, iterations=100, seed=42) if G.number_of_nodes() else {}
+        if 'children' not in mindmap:
+            mindmap['children'], mindmap['parents'] = build_tree_index(G)
+        subG = get_subgraph(G, focus, mindmap['children'], mindmap['parents'])
+        views[focus] = (subG, {node: mindmap['positions'][node] for node in subG})
+    return views[focus]
 
+def render_mindmap_png(subG, pos, current_root, selected_node):
+    """Draws the subgraph with matplotlib and returns it as PNG bytes"""
     fig, ax = plt.subplots(figsize=(12, 8), facecolor='#f8f9fa')
-    if subG.number_of_nodes() > 0:
-        pos = nx.spring_layout(subG, k=1.5, iterations=100, seed=42)
-    else:
-        pos = {}
-
-    edge_styles = {
-        'contains': {'style': 'dashed', 'width': 2, 'color': '#6c757d'},
-        'related': {'style': 'solid', 'width': 1.5, 'color': '#495057'},
-        'influences': {'style': 'solid', 'width': 2, 'color': '#2b8a3e', 'alpha': 0.8}
-    }
-    
+
+    edges_by_relation = {}
     for u, v, data in subG.edges(data=True):
         relation = data.get('relation', 'related')
-        style = edge_styles.get(relation, edge_styles['related'])
+        edges_by_relation.setdefault(relation if relation in EDGE_STYLES else 'related', []).append((u, v))
+    for relation, edgelist in edges_by_relation.items():
+        style = EDGE_STYLES[relation]
         nx.draw_networkx_edges(
-            subG, pos, edgelist=[(u, v)],
+            subG, pos, edgelist=edgelist,
             width=style['width'],
             style=style['style'],
             edge_color=style['color'],
@@ -135,7 +340,7 @@ def draw_interactive_mindmap():
     node_colors = []
     node_sizes = []
     for node in subG.nodes():
-        if node == st.session_state.mindmap.get('selected_node'):
+        if node == selected_node:
             node_colors.append('#ff9f1c') 
         elif node == current_root:
             node_colors.append('#2b8a3e') 
@@ -163,8 +368,85 @@ def draw_interactive_mindmap():
             bbox=dict(facecolor='white', edgecolor='none', alpha=0.7, boxstyle='round,pad=0.3')
         )
 
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', facecolor=fig.get_facecolor())
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def mindmap_client_data(G):
+    """Serializes the graph into the vis-network nodes/edges format of the browser view"""
+    nodes = [{
+        'id': node,
+        'label': node,
+        'title': data.get('description', 'No description available'),
+        'color': data.get('color', '#4dabf7'),
+        'size': data.get('size', 1500) / 100,
+    } for node, data in G.nodes(data=True)]
+    edges = []
+    for u, v, data in G.edges(data=True):
+        relation = data.get('relation', 'related')
+        style = EDGE_STYLES.get(relation, EDGE_STYLES['related'])
+        edges.append({
+            'from': u,
+            'to': v,
+            'title': relation,
+            'dashes': style['style'] == 'dashed',
+            'width': style['width'],
+            'color': {'color': style['color'], 'opacity': style.get('alpha', 0.7)},
+        })
+    return {'nodes': nodes, 'edges': edges}
+
+def apply_client_selection():
+    """Takes a node click of the browser view into the session's selected_node.
+
+    The click's rerun reaches the code above draw_client_mindmap() first, so the app calls this
+    before acting on the selection (e.g. expanding the clicked node).
+    """
+    mindmap = st.session_state.get('mindmap') or {}
+    event = st.session_state.get("mindmap_view")
+    if mindmap.get('graph') is None or not event or event.get('event') == mindmap.get('last_client_event'):
+        return
+    mindmap['last_client_event'] = event.get('event')
+    if event.get('node') in mindmap['graph']:
+        mindmap['selected_node'] = event['node']
+
+def draw_client_mindmap(height=600):
+    """Renders the whole map in the browser with vis-network.
+
+    Panning, zooming and collapsing happen client-side; only a click on a node comes back and
+    becomes the selected node. The browser rebuilds the network only when the graph version changes.
+    """
+    if 'mindmap' not in st.session_state or not st.session_state.mindmap['graph']:
+        return
+
+    mindmap = st.session_state.mindmap
+    if 'client_graph' not in mindmap:
+        data = mindmap_client_data(mindmap['graph'])
+        version = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+        mindmap['client_graph'] = (data, version)
+    data, version = mindmap['client_graph']
+
+    _mindmap_component(graph=data, version=version, height=height,
+                       selected=mindmap.get('selected_node'), key="mindmap_view", default=None)
+    apply_client_selection()
+
+def draw_interactive_mindmap():
+    """Draw interactive mind map with navigation using Streamlit components"""
+    if 'mindmap' not in st.session_state or not st.session_state.mindmap['graph']:
+        return
+
+    mindmap = st.session_state.mindmap
+    G = mindmap['graph']
+    current_root = mindmap['current_focus']
+    subG, pos = get_focus_view(mindmap)
 
-    st.pyplot(fig, use_container_width=True)
+    # the picture only changes with the focus and the highlighted node
+    image_key = (current_root, mindmap.get('selected_node'))
+    images = mindmap.setdefault('images', {})
+    if image_key not in images:
+        images[image_key] = render_mindmap_png(subG, pos, current_root, mindmap.get('selected_node'))
+    st.image(images[image_key], use_container_width=True)
 
 
     col1, col2 = st.columns([3, 1])
@@ -207,7 +489,8 @@ def navigate_up():
         
     G = st.session_state.mindmap['graph']
     current = st.session_state.mindmap['current_focus']
-    predecessors = list(G.predecessors(current))
+    parents = st.session_state.mindmap.get('parents')
+    predecessors = parents.get(current, []) if parents else list(G.predecessors(current))
     
     if predecessors:
         st.session_state.mindmap['current_focus'] = predecessors[0]
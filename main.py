@@ -2,7 +2,8 @@ import streamlit as st
 import auth 
 import app 
 import time
-from database import database_manager
+from database import database_manager, ingestion_jobs
+import metrics
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
     st.session_state.page = "login"
@@ -17,7 +18,9 @@ def generate_key(prefix):
 
 def main():
     # database_setup.main() <- initializing db when we start using programme
-    database_manager.sync_projects_directory()
-    app.main_app()
+    ingestion_jobs.resume_interrupted_jobs()
+    database_manager.sync_projects_directory(ingest=ingestion_jobs.submit_ingestion)
+    with metrics.request("page"):
+        app.main_app()
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,184 @@
+"""Lightweight timing spans for the ingestion, retrieval and generation pipeline.
+
+Enable with METRICS_ENABLED=1 (e.g. in .env). Spans are aggregated per stage for the Prometheus
+text export and, on the thread that opened a request() and in worker tasks wrapped with bind(),
+collected per request; finished requests are kept in memory and appended to METRICS_JSONL_PATH when
+it is set. When disabled span() returns a shared no-op object, so instrumented code pays one function
+call and one branch per span.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+# show the timings panel in the app sidebar
+SHOW_PANEL = os.getenv("METRICS_PANEL", "0") == "1"
+JSONL_PATH = os.getenv("METRICS_JSONL_PATH")
+PROMETHEUS_PATH = os.getenv("METRICS_PROMETHEUS_PATH")
+RECENT_REQUESTS = 20
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_local = threading.local()
+_lock = threading.Lock()
+# stage -> [count, sum, per-bucket counts]
+_stages = {}
+_recent = deque(maxlen=RECENT_REQUESTS)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name):
+    """Context manager that times the enclosed block as one occurrence of stage `name`"""
+    if not ENABLED:
+        return _NOOP
+    return _Span(name)
+
+
+def timed(name):
+    """Decorator version of span() for functions that are one stage as a whole"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, seconds):
+    """Adds an externally measured duration, e.g. one reported back by a worker process"""
+    if not ENABLED:
+        return
+    with _lock:
+        stage = _stages.get(name)
+        if stage is None:
+            stage = _stages[name] = [0, 0.0, [0] * len(BUCKETS)]
+        stage[0] += 1
+        stage[1] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stage[2][i] += 1
+    current = getattr(_local, 'request', None)
+    if current is not None:
+        current['spans'].append({'stage': name, 'ms': round(seconds * 1000, 3)})
+
+
+class _Request:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'request', None)
+        self.start = time.perf_counter()
+        _local.request = {'name': self.name, 'started_at': time.time(), 'spans': []}
+        return _local.request
+
+    def __exit__(self, exc_type, *exc):
+        finished = _local.request
+        _local.request = self.previous
+        finished['total_ms'] = round((time.perf_counter() - self.start) * 1000, 3)
+        if not finished['spans']:
+            return False
+        with _lock:
+            _recent.append(finished)
+        if JSONL_PATH:
+            with open(JSONL_PATH, "a") as f:
+                f.write(json.dumps(finished) + "\n")
+        if PROMETHEUS_PATH:
+            with open(PROMETHEUS_PATH, "w") as f:
+                f.write(prometheus_text())
+        return False
+
+
+def request(name):
+    """Context manager that collects the spans recorded on this thread into one request record"""
+    if not ENABLED:
+        return _NOOP
+    return _Request(name)
+
+
+def bind(fn):
+    """Wraps fn so that spans it records on a worker thread count toward the calling thread's request"""
+    current = getattr(_local, 'request', None)
+    if current is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, 'request', None)
+        _local.request = current
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.request = previous
+    return wrapper
+
+
+def set_request_name(name):
+    """Renames the request running on this thread, e.g. after it turned out to be a quiz generation"""
+    current = getattr(_local, 'request', None)
+    if current is not None:
+        current['name'] = name
+
+
+def recent_requests():
+    """Finished requests with at least one span, newest first"""
+    with _lock:
+        return list(reversed(_recent))
+
+
+def stage_totals(spans):
+    """{stage: (count, total ms)} of a request's spans"""
+    totals = {}
+    for s in spans:
+        count, ms = totals.get(s['stage'], (0, 0.0))
+        totals[s['stage']] = (count + 1, ms + s['ms'])
+    return totals
+
+
+def prometheus_text():
+    """Per-stage duration histograms in the Prometheus text exposition format"""
+    lines = [
+        "# HELP study_aid_stage_seconds Time spent per pipeline stage.",
+        "# TYPE study_aid_stage_seconds histogram",
+    ]
+    with _lock:
+        stages = {name: (count, total, list(buckets)) for name, (count, total, buckets) in _stages.items()}
+    for name in sorted(stages):
+        count, total, buckets = stages[name]
+        for bound, bucket_count in zip(BUCKETS, buckets):
+            lines.append(f'study_aid_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {bucket_count}')
+        lines.append(f'study_aid_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+        lines.append(f'study_aid_stage_seconds_sum{{stage="{name}"}} {total}')
+        lines.append(f'study_aid_stage_seconds_count{{stage="{name}"}} {count}')
+    return "\n".join(lines) + "\n"
@@ -2,7 +2,8 @@ import json
 import re
 import fitz
 import streamlit as st
-from client import model
+from client import model, stream_content
+import metrics
 import os
 
 def display_pdf_preview(pdf_path: str):
@@ -53,12 +54,9 @@ def extract_text_from_pdf(pdf_file):
         st.error(f"PDF error: {str(e)}")
         return ""
 
-def generate_quiz_questions(pdf_text, num_questions=10, difficulty="Medium"):
-    """Generates quiz questions with strict formatting"""
-    if not pdf_text.strip():
-        return ""
-    
-    prompt = f"""
+def quiz_prompt(pdf_text, num_questions=10, difficulty="Medium"):
+    """Builds the quiz generation prompt with strict formatting"""
+    return f"""
     Generate exactly {num_questions} multiple-choice questions about this text. For each question explain context shortly so that reader may not rely on context, but just on question. 
     Difficulty: {difficulty}
     Format each question exactly like this:
@@ -73,51 +71,82 @@ def generate_quiz_questions(pdf_text, num_questions=10, difficulty="Medium"):
     Text:
     {pdf_text[:10000]}
     """
+
+@metrics.timed("llm_quiz")
+def generate_quiz_questions(pdf_text, num_questions=10, difficulty="Medium"):
+    """Generates quiz questions with strict formatting"""
+    if not pdf_text.strip():
+        return ""
     
     try:
-        response = model.generate_content(prompt)
+        response = model.generate_content(quiz_prompt(pdf_text, num_questions, difficulty))
         return response.text if response else ""
     except Exception as e:
         st.error(f"Generation error: {str(e)}")
         return ""
 
-def parse_quiz_questions(quiz_text, quiz_json_path):
-    """Parses raw quiz text into a list of question dictionaries, extracting the question, options, and correct answer"""
-    if not quiz_text.strip():
-        return []
-    
-    questions = []
+def generate_quiz_questions_stream(pdf_text, num_questions=10, difficulty="Medium"):
+    """Streaming variant of generate_quiz_questions, yields the raw quiz text as it arrives.
+
+    Like there, a generation error is shown with st.error; the questions completed before it are kept.
+    """
+    if not pdf_text.strip():
+        return
+    yield from stream_content(quiz_prompt(pdf_text, num_questions, difficulty))
+
+def iter_stream_lines(text_stream):
+    """Regroups streamed text pieces into complete lines"""
+    buffer = ""
+    for piece in text_stream:
+        buffer += piece
+        *lines, buffer = buffer.split('\n')
+        yield from lines
+    if buffer:
+        yield buffer
+
+def stream_quiz_questions(pdf_text, num_questions=10, difficulty="Medium"):
+    """Generates a quiz and yields each parsed question dictionary as soon as it is complete"""
+    return iter_quiz_questions(iter_stream_lines(generate_quiz_questions_stream(pdf_text, num_questions, difficulty)))
+
+def iter_quiz_questions(lines):
+    """Yields each question dictionary as soon as its correct answer line has been read"""
     current_question = None
-    
-    for line in quiz_text.split('\n'):
+    for line in lines:
         line = line.strip()
         if line.startswith("Question"):
-            if current_question:
-                questions.append(current_question)
             current_question = {
-                'question': line.split(":", 1)[1].strip(),
+                'question': line.split(":", 1)[1].strip() if ":" in line else "",
                 'options': [],
                 'answer': None
             }
+        elif current_question is None:
+            continue
         elif line.startswith(('A)', 'B)', 'C)', 'D)')):
             option = line[2:].strip()
             current_question['options'].append(option)
         elif line.startswith("Correct Answer:"):
-            answer_letter = line.split(":", 1)[1].strip().upper()
+            answer_letter = line.split(":", 1)[1].strip().upper()[:1]
             if answer_letter in ['A', 'B', 'C', 'D']:
                 idx = ord(answer_letter) - ord('A')
                 if idx < len(current_question['options']):
                     current_question['answer'] = current_question['options'][idx]
-    
-    if current_question and current_question['options'] and current_question['answer']:
-        questions.append(current_question)
-
+                    yield current_question
+            current_question = None
 
+def save_quiz_questions(questions, quiz_json_path):
     with open(quiz_json_path, 'w') as f:
         json.dump(questions, f, indent=4)
+
+def parse_quiz_questions(quiz_text, quiz_json_path):
+    """Parses raw quiz text into a list of question dictionaries, extracting the question, options, and correct answer"""
+    if not quiz_text.strip():
+        return []
     
+    questions = list(iter_quiz_questions(quiz_text.split('\n')))
+    save_quiz_questions(questions, quiz_json_path)
     return questions
 
+@metrics.timed("llm_flashcards")
 def generate_flashcards(pdf_text, num_cards=10):
     """Generates flashcards in JSON format"""
     if not pdf_text.strip():
@@ -0,0 +1,47 @@
+import numpy as np
+from database.ann_index import IVFIndex
+
+
+def _trained_index(path, rows=500, dim=16):
+    rng = np.random.default_rng(0)
+    index = IVFIndex(str(path))
+    index.build(np.arange(1, rows + 1), rng.normal(size=(rows, dim)).astype(np.float32))
+    return index, rng
+
+
+def test_save_after_load_keeps_the_index(tmp_path):
+    index, rng = _trained_index(tmp_path / "ann_index")
+    index.save()
+    query = rng.normal(size=16).astype(np.float32)
+    expected_scores, expected_ids = index.search(query, top_k=10)
+
+    loaded = IVFIndex(str(tmp_path / "ann_index"))
+    assert loaded.load()
+    # vectors.npy is memory-mapped by `loaded` while it is written again
+    loaded.save()
+
+    reloaded = IVFIndex(str(tmp_path / "ann_index"))
+    assert reloaded.load()
+    assert reloaded.size == index.size
+    np.testing.assert_array_equal(reloaded.ids, index.ids)
+    np.testing.assert_array_equal(np.asarray(reloaded.vectors), index.vectors)
+    scores, ids = reloaded.search(query, top_k=10)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+    # the map taken before the save still reads the old, complete file
+    assert np.asarray(loaded.vectors).shape == index.vectors.shape
+
+
+def test_add_after_load_is_saved(tmp_path):
+    index, rng = _trained_index(tmp_path / "ann_index")
+    index.save()
+
+    loaded = IVFIndex(str(tmp_path / "ann_index"))
+    loaded.load()
+    loaded.add([1001, 1002], rng.normal(size=(2, 16)).astype(np.float32))
+    loaded.save()
+
+    reloaded = IVFIndex(str(tmp_path / "ann_index"))
+    reloaded.load()
+    assert reloaded.size == index.size + 2
+    assert {1001, 1002} <= set(reloaded.ids.tolist())